@@ -0,0 +1,579 @@
+"""Benchmarks offline do bot (não conecta no Discord nem no GitHub).
+
+Uso:
+    python bench.py regras [--mensagens 50000]
+    python bench.py spam [--mensagens 50000]
+    python bench.py avatares [--repeticoes 20]
+    python bench.py codificacao [--repeticoes 10]
+    python bench.py renderizacao [--repeticoes 30] [--salvar-baseline] [--atualizar-golden]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import json
+import asyncio
+import resource
+import multiprocessing
+import tempfile
+import statistics
+from io import BytesIO
+
+# main.py exige os tokens no import; os benchmarks nunca os usam
+os.environ.setdefault("BOT_TOKEN", "bench")
+os.environ.setdefault("GITHUB_TOKEN", "bench")
+
+import main
+
+# ========================
+# CORPUS SINTÉTICO
+# ========================
+WORDS = [
+    "oi", "tudo", "bem", "alguém", "jogando", "hoje", "kkkk", "bora", "call", "valeu",
+    "mano", "que", "isso", "nossa", "sério", "amanhã", "partida", "rank", "top", "boa",
+]
+
+def synthetic_corpus(n, seed=42):
+    """Mistura de conversa comum, comandos da Mudae, GIFs, links e CAPS"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        kind = rng.random()
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 18)))
+        if kind < 0.10:
+            corpus.append(rng.choice(main.MUDAE_COMMANDS) + " " + rng.choice(WORDS))
+        elif kind < 0.18:
+            corpus.append(f"{words} https://media.tenor.com/view/{rng.randint(1, 10**6)}.gif")
+        elif kind < 0.26:
+            corpus.append(f"olha isso https://exemplo.com.br/p/{rng.randint(1, 10**6)} {words}")
+        elif kind < 0.30:
+            corpus.append(words.upper())
+        else:
+            corpus.append(words)
+    return corpus
+
+# ========================
+# REGRAS DE MODERAÇÃO
+# ========================
+def legacy_classify(content):
+    """Reprodução das checagens do on_message antes do motor de regras"""
+    content = content.strip()
+    mudae_commands = [
+        "$w", "$wa", "$wg", "$h", "$ha", "$hg",
+        "$W", "$WA", "$WG", "$H", "$HA", "$HG",
+        "$tu", "$TU", "$dk", "$mmi", "$vote", "$rolls", "$k", "$mu"
+    ]
+    is_bot_command = any(content.lower().startswith(cmd) for cmd in mudae_commands)
+    gif_domains = ["tenor.com", "media.tenor.com", "giphy.com", "imgur.com"]
+    has_media = any(domain in content.lower() for domain in gif_domains)
+    import re
+    url_pattern = r"https?://[^\s]+"
+    has_url = bool(re.search(url_pattern, content))
+    is_caps = len(content) > 5 and content.isupper()
+    return is_bot_command, has_media, has_url, is_caps
+
+# (texto, é mídia) nos casos em que a checagem por substring errava
+GIF_HOST_CASES = [
+    ("https://media.tenor.com/view/x.gif", True),
+    ("https://i.imgur.com/abc.png", True),
+    ("https://user@Giphy.com:443/gifs/x", True),
+    ("olha https://notimgur.com.evil/x", False),
+    ("https://evil.com/tenor.com", False),
+    ("https://tenor.com.evil/x", False),
+    ("https://tenor.com/x https://evil.com/y", False),
+    ("https://tenor.com/x https://i.imgur.com/y.gif", True),
+]
+
+def bench_rules(args):
+    corpus = synthetic_corpus(args.mensagens)
+    engine = main.build_moderation_engine()
+
+    mismatches = 0
+    for content, expected in GIF_HOST_CASES:
+        if engine.classify(content).has_media != expected:
+            print(f"  ❌ domínio de GIF: {content!r} deveria ser {expected}")
+            mismatches += 1
+    for content in corpus:
+        v = engine.classify(content)
+        if (v.is_bot_command, v.has_media, bool(v.urls), v.is_caps) != legacy_classify(content):
+            mismatches += 1
+
+    def run(fn):
+        best = float("inf")
+        for _ in range(args.repeticoes):
+            t0 = time.perf_counter()
+            for content in corpus:
+                fn(content)
+            best = min(best, time.perf_counter() - t0)
+        return best / len(corpus) * 1e9
+
+    legacy_ns = run(legacy_classify)
+    engine_ns = run(engine.classify)
+
+    print(f"Corpus: {len(corpus)} mensagens sintéticas")
+    print(f"  antes (checagens inline): {legacy_ns:8.0f} ns/mensagem")
+    print(f"  depois (motor compilado): {engine_ns:8.0f} ns/mensagem")
+    print(f"  ganho: {legacy_ns / engine_ns:.2f}x | divergências: {mismatches}")
+    return 0 if mismatches == 0 else 1
+
+# ========================
+# DETECÇÃO DE SPAM
+# ========================
+def spam_scenarios():
+    """Fluxos gravados (ts, usuário, canal, texto) com o veredito esperado por mensagem"""
+    return {
+        "conversa normal": (
+            [(t * 7.0, "a", 1, f"{WORDS[t]} {WORDS[t + 1]} {WORDS[t + 2]}") for t in range(10)],
+            [None] * 10,
+        ),
+        "repetição exata": (
+            [(0, "a", 1, "alguém joga hoje?"), (5, "a", 1, "alguém joga hoje?")],
+            [None, "duplicate"],
+        ),
+        "variação trivial": (
+            [(0, "a", 1, "compre seguidores baratos"), (4, "a", 1, "Compre seguidores baratooooos!!!")],
+            [None, "duplicate"],
+        ),
+        "quase repetição": (
+            [(0, "a", 1, "entra no meu servidor tem sorteio de nitro todo dia"),
+             (6, "a", 1, "entra no meu servidor tem sorteio de nitro todo dia hoje")],
+            [None, "duplicate"],
+        ),
+        "rajada entre canais": (
+            [(0, "a", 1, "free nitro aqui"), (1, "a", 2, "free nitro aqui"), (2, "a", 3, "free nitro aqui")],
+            [None, "duplicate", "cross_channel"],
+        ),
+        "taxa": (
+            [(t * 1.0, "a", 1, f"msg {WORDS[t]} {t}") for t in range(7)],
+            [None] * 6 + ["rate"],
+        ),
+        "repetição depois da janela": (
+            [(0, "a", 1, "bom dia"), (500, "a", 1, "bom dia")],
+            [None, None],
+        ),
+        "respostas curtas": (
+            [(0, "a", 1, "ok"), (10, "a", 1, "sim"), (20, "a", 1, "kkkk"), (30, "a", 1, "ok"),
+             (40, "a", 2, "kkkkkkk"), (50, "a", 3, "sim"), (60, "a", 1, "valeu mano"), (70, "a", 1, "valeu mano")],
+            [None] * 8,
+        ),
+        "usuários diferentes": (
+            [(0, "a", 1, "bom dia"), (1, "b", 1, "bom dia")],
+            [None, None],
+        ),
+    }
+
+def bench_spam(args):
+    failures = 0
+    for name, (stream, expected) in spam_scenarios().items():
+        got = main.SpamDetector().replay(stream)
+        ok = got == expected
+        failures += not ok
+        print(f"  {'✅' if ok else '❌'} {name}" + ("" if ok else f": esperado {expected}, obtido {got}"))
+
+    # Custo por mensagem e memória limitada num fluxo longo com muitos usuários
+    rng = random.Random(7)
+    corpus = synthetic_corpus(args.mensagens)
+    stream = [(i * 0.01, str(rng.randint(1, args.usuarios)), rng.randint(1, 20), text.lower())
+              for i, text in enumerate(corpus)]
+    detector = main.SpamDetector({"max_users": args.usuarios // 2})
+    t0 = time.perf_counter()
+    detector.replay(stream)
+    elapsed = time.perf_counter() - t0
+    print(f"Fluxo: {len(stream)} mensagens, {args.usuarios} usuários")
+    print(f"  {elapsed / len(stream) * 1e9:.0f} ns/mensagem | usuários acompanhados: {len(detector.users)}")
+    return 0 if failures == 0 else 1
+
+# ========================
+# AVATARES
+# ========================
+def synthetic_avatar(size, fmt, seed=1):
+    """Avatar com gradiente e ruído (comprime como foto); GIF sai animado com 8 quadros"""
+    from PIL import Image, ImageDraw
+    rng = random.Random(seed)
+    frames = []
+    for f in range(8 if fmt == "GIF" else 1):
+        img = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+        draw = ImageDraw.Draw(img)
+        for _ in range(size // 4):
+            x, y = rng.randrange(size), rng.randrange(size)
+            r = rng.randint(2, max(3, size // 16))
+            draw.ellipse((x, y, x + r, y + r), fill=(rng.randrange(256), rng.randrange(256), (f * 30) % 256))
+        frames.append(img)
+    buf = BytesIO()
+    if fmt == "GIF":
+        frames[0].save(buf, format="GIF", save_all=True, append_images=frames[1:], duration=80, loop=0)
+    else:
+        frames[0].save(buf, format=fmt)
+    return buf.getvalue()
+
+def legacy_avatar_tile(raw, kind):
+    """Tile montado como antes: avatar inteiro em resolução cheia, sem draft"""
+    from PIL import Image
+    avatar = Image.open(BytesIO(raw)).convert("RGBA")
+    if kind == "rank":
+        return avatar.resize((main.RANK_AVATAR, main.RANK_AVATAR))
+    size = main.WELCOME_AVATAR * main.WELCOME_UPSCALE
+    border_h = main.AVATAR_TILE_SIZES["welcome"]
+    border = main.border_disc(border_h * main.WELCOME_UPSCALE, main.WELCOME_BORDER_COLOR).copy()
+    offset = main.WELCOME_BORDER * main.WELCOME_UPSCALE
+    border.paste(avatar.resize((size, size)), (offset, offset), main.circle_mask(size))
+    return border.resize((border_h, border_h), Image.Resampling.LANCZOS)
+
+def bench_avatars(args):
+    # O que o CDN devolvia (tamanho cheio) x o que devolve com with_size/with_static_format
+    sources = [("PNG 1024", 1024, "PNG"), ("JPEG 1024", 1024, "JPEG"), ("WEBP 1024", 1024, "WEBP"), ("GIF animado 512", 512, "GIF")]
+    failures = 0
+    print(f"{'avatar':<16} {'cartão':<8} {'bytes antes':>12} {'bytes depois':>13} {'tile antes':>13} {'tile depois':>14}")
+    for label, size, fmt in sources:
+        full = synthetic_avatar(size, fmt)
+        for kind in ("rank", "welcome"):
+            sized_px = main.cdn_size(main.AVATAR_TILE_SIZES[kind])
+            sized = synthetic_avatar(sized_px, fmt if fmt == "GIF" else "PNG")
+
+            def run(fn, raw):
+                best = float("inf")
+                for _ in range(args.repeticoes):
+                    t0 = time.perf_counter()
+                    fn(raw, kind)
+                    best = min(best, time.perf_counter() - t0)
+                return best * 1000
+
+            before_ms = run(legacy_avatar_tile, full)
+            after_ms = run(main._avatar_tile_image, sized)
+            failures += after_ms > before_ms
+            print(f"{label:<16} {kind:<8} {len(full):>12,} {len(sized):>13,} {before_ms:>11.2f}ms {after_ms:>12.2f}ms")
+    return 0 if failures == 0 else 1
+
+# ========================
+# CODIFICAÇÃO DOS CARTÕES
+# ========================
+def sample_cards(tmpdir):
+    """Cartões padrão como o bot gera: rank (cor chapada) e boas-vindas com foto de fundo"""
+    from PIL import Image
+    avatar = synthetic_avatar(256, "PNG")
+    background = os.path.join(tmpdir, "fundo.png")
+    main.prepare_welcome_background(synthetic_avatar(900, "JPEG", seed=3)).save(background)
+    cards = {}
+    for name, spec in (
+        ("rank", {"name": "Fulano de Tal", "position": 7, "level": 12, "xp": 15234}),
+        ("boas-vindas", {"name": "Fulano de Tal", "count_text": "Membro #1234", "background_path": background}),
+    ):
+        kind = "rank" if name == "rank" else "welcome"
+        spec["avatar_tile"] = main.render_avatar_tile({"avatar": avatar, "kind": kind})
+        spec["encoder"] = dict(main.DEFAULT_ENCODER_CONFIG)
+        render = main.render_rank_card if kind == "rank" else main.render_welcome_card
+        cards[name] = Image.open(BytesIO(render(spec))).convert("RGBA")
+    return cards
+
+def bench_encoders(args):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cards = sample_cards(tmpdir)
+    print(f"{'cartão':<12} {'perfil':<14} {'p50':>9} {'máx':>9} {'bytes':>10} {'formato':>8}")
+    failures = 0
+    for name, img in cards.items():
+        baseline = None
+        for profile in main.ENCODER_PROFILES:
+            encoder = dict(main.DEFAULT_ENCODER_CONFIG, profile=profile, budget_ms=args.orcamento)
+            times = []
+            for _ in range(args.repeticoes):
+                t0 = time.perf_counter()
+                out = main.encode_card(img, encoder)
+                times.append((time.perf_counter() - t0) * 1000)
+            baseline = baseline or len(out)
+            ext = main.card_filename("x", out).split(".")[-1]
+            print(f"{name:<12} {profile:<14} {statistics.median(times):>7.2f}ms {max(times):>7.2f}ms "
+                  f"{len(out):>10,} {ext:>8}")
+            if profile == "auto":
+                # O automático nunca pode sair maior que o PNG padrão
+                failures += len(out) > baseline
+    return 0 if failures == 0 else 1
+
+# ========================
+# RENDERIZAÇÃO (REGRESSÃO)
+# ========================
+# Roda on_member_join, /perfil e /rank imagem de verdade, com objetos do
+# Discord falsos, avatares e fundo sintéticos (determinísticos) e sem GitHub.
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCH_DIR, "bench_baseline.json")
+GOLDEN_DIR = os.path.join(BENCH_DIR, "bench_golden")
+GOLDEN_CHANNEL_DELTA = 8   # diferença por canal abaixo disso não conta (versões de freetype/libjpeg)
+TIMING_SLACK_MS = 1.0      # folga absoluta: acertos de cache em µs variam mais que o limite relativo
+FIXTURE_BG_URL = "https://fixture.invalid/fundo.jpg"
+
+class FakeAsset:
+    def __init__(self, raw, key):
+        self.raw = raw
+        self.key = key
+
+    def with_size(self, size):
+        return self
+
+    def with_static_format(self, fmt):
+        return self
+
+    async def read(self):
+        return self.raw
+
+class FakeChannel:
+    def __init__(self, name="boas-vindas"):
+        self.id = 1
+        self.name = name
+        self.sent = []
+
+    async def send(self, content=None, file=None, **kwargs):
+        self.sent.append((content, file.fp.getvalue() if file else None))
+
+class FakeGuild:
+    def __init__(self):
+        self.id = 1
+        self.members = []
+        self.text_channels = [FakeChannel()]
+
+    def get_channel(self, channel_id):
+        return None
+
+    def get_member(self, member_id):
+        return next((m for m in self.members if m.id == member_id), None)
+
+class FakeMember:
+    def __init__(self, guild, member_id, name, avatar):
+        self.guild = guild
+        self.id = member_id
+        self.display_name = name
+        self.mention = f"<@{member_id}>"
+        self.display_avatar = FakeAsset(avatar, f"avatar{member_id}")
+
+    def __str__(self):
+        return self.display_name
+
+class FakeResponse:
+    async def defer(self, **kwargs):
+        pass
+
+class FakeInteraction:
+    def __init__(self, user):
+        self.user = user
+        self.guild = user.guild
+        self.channel_id = 1
+        self.response = FakeResponse()
+        self.followup = FakeChannel("followup")
+
+def render_fixtures(tmpdir):
+    """Servidor com 30 membros de XP decrescente e o fundo de boas-vindas já preparado"""
+    guild = FakeGuild()
+    fmts = ["PNG", "JPEG", "WEBP", "GIF"]
+    for i in range(30):
+        avatar = synthetic_avatar(128, fmts[i % 4], seed=i + 1)
+        guild.members.append(FakeMember(guild, 1000 + i, f"Membro {i + 1:02d} Ação", avatar))
+    main.data["xp"] = {str(m.id): 50000 - i * 1234 for i, m in enumerate(guild.members)}
+    main.data["level"] = {uid: main.xp_to_level(xp) for uid, xp in main.data["xp"].items()}
+
+    bg_cache = main.WelcomeBackgroundCache(cache_dir=tmpdir)
+    bg_cache.path = os.path.join(tmpdir, "fundo.png")
+    main.prepare_welcome_background(synthetic_avatar(900, "JPEG", seed=99)).save(bg_cache.path)
+    bg_cache.url, bg_cache.fetched = FIXTURE_BG_URL, time.time()
+    main.welcome_bg_cache = bg_cache
+    main.cfg = main.CompiledConfig({"config": {"welcome_background": FIXTURE_BG_URL}})
+    return guild
+
+def reset_render_caches():
+    main.avatar_cache = main.ByteLRU(main.AVATAR_CACHE_BYTES)
+    main.rank_card_cache = main.ByteLRU(main.RANK_CARD_CACHE_BYTES)
+    main.leaderboard_cache = main.ByteLRU(main.LEADERBOARD_CACHE_BYTES)
+    main.raid_guards.clear()
+
+def render_cases(guild):
+    """Tipo de cartão -> (corrotina que roda o handler e devolve os bytes, zera caches antes?)"""
+    member = guild.members[3]
+
+    async def welcome():
+        channel = guild.text_channels[0]
+        await main.on_member_join(member)
+        return channel.sent.pop()[1]
+
+    async def rank():
+        interaction = FakeInteraction(member)
+        await main.slash_rank.callback(interaction, None, None)
+        return interaction.followup.sent.pop()[1]
+
+    async def leaderboard():
+        interaction = FakeInteraction(member)
+        await main.slash_top.callback(interaction, None, 1, True)
+        return interaction.followup.sent.pop()[1]
+
+    return {
+        "boas-vindas": (welcome, True),
+        "rank": (rank, True),
+        "rank (cache)": (rank, False),
+        "placar": (leaderboard, True),
+        "placar (cache)": (leaderboard, False),
+    }
+
+RENDER_CARDS = ("boas-vindas", "rank", "rank (cache)", "placar", "placar (cache)")
+
+def golden_name(card):
+    return {"boas-vindas": "welcome", "rank": "rank", "placar": "leaderboard"}.get(card)
+
+def pixel_diff(raw, path):
+    """Fração de pixels que diferem da imagem de referência (1.0 se o tamanho mudou)"""
+    from PIL import Image, ImageChops
+    got = Image.open(BytesIO(raw)).convert("RGBA")
+    ref = Image.open(path).convert("RGBA")
+    if got.size != ref.size:
+        return 1.0
+    diff = ImageChops.difference(got, ref)
+    worst = diff.getchannel(0)
+    for band in diff.split()[1:]:
+        worst = ImageChops.lighter(worst, band)
+    changed = worst.point(lambda v: 255 if v > GOLDEN_CHANNEL_DELTA else 0).histogram()[255]
+    return changed / (got.width * got.height)
+
+async def run_render_case(card, repetitions, processes, guild):
+    await main.render_service.start(processes=processes)
+    case, cold = render_cases(guild)[card]
+    reset_render_caches()
+    raw = await case()  # aquecimento: fontes, bases dos templates e, nos casos "cache", o próprio cartão
+    times = []
+    for _ in range(repetitions):
+        if cold:
+            reset_render_caches()
+        t0 = time.perf_counter()
+        raw = await case()
+        times.append((time.perf_counter() - t0) * 1000)
+    cuts = statistics.quantiles(times, n=20, method="inclusive")
+    return {
+        "p50_ms": round(statistics.median(times), 2),
+        "p95_ms": round(cuts[18], 2),
+        "bytes": len(raw),
+        # Processo novo por caso: ru_maxrss (KB no Linux) é o pico só deste cartão
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "mode": main.render_service.mode,
+        "_raw": raw,
+    }
+
+def render_case_worker(card, repetitions, processes, results):
+    """Roda um tipo de cartão num processo próprio e devolve o resultado pela fila"""
+    # Nada de GitHub: add_log e companhia salvam por aqui
+    main.save_data_to_github = lambda message="": True
+    with tempfile.TemporaryDirectory() as tmpdir:
+        guild = render_fixtures(tmpdir)
+        result = asyncio.run(run_render_case(card, repetitions, processes, guild))
+    # Fecha o pool antes de sair, senão os workers ainda subindo perdem os semáforos do processo
+    main.render_service.executor.shutdown(wait=True)
+    results.put(result)
+
+def run_render_suite(args):
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for card in RENDER_CARDS:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=render_case_worker, args=(card, args.repeticoes, args.processos, queue))
+        proc.start()
+        results[card] = queue.get()
+        proc.join()
+    return results
+
+def bench_render(args):
+    results = run_render_suite(args)
+    mode = next(iter(results.values()))["mode"]
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            baseline = json.load(f)
+    limit = args.limite if args.limite is not None else baseline.get("limit", 0.25)
+    if baseline.get("mode", mode) != mode:
+        # Threads x processos não são comparáveis: só o golden vale nesta rodada
+        print(f"⚠️ Baseline gravada no modo {baseline['mode']}; números não comparados")
+        baseline = {}
+    metrics = ("p50_ms", "p95_ms", "bytes", "peak_rss_mb")
+    # p95 de poucas repetições varia demais entre rodadas: fica só no relatório
+    gated = ("p50_ms", "bytes", "peak_rss_mb")
+
+    failures = 0
+    print(f"Modo: {mode} | {args.repeticoes} repetições | limite +{limit:.0%} sobre a baseline")
+    print(f"{'cartão':<16} {'p50':>9} {'p95':>9} {'bytes':>10} {'pico RSS':>10} {'golden':>10}")
+    for card, result in results.items():
+        base = baseline.get("cards", {}).get(card, {})
+        worse = [
+            m for m in gated if m in base and result[m] > base[m] * (1 + limit)
+            and (not m.endswith("_ms") or result[m] > base[m] + TIMING_SLACK_MS)
+        ]
+        golden = golden_name(card)
+        diff_text = "-"
+        if golden:
+            path = os.path.join(GOLDEN_DIR, f"{golden}.png")
+            if args.atualizar_golden:
+                os.makedirs(GOLDEN_DIR, exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(result["_raw"])
+                diff_text = "gravado"
+            elif os.path.exists(path):
+                diff = pixel_diff(result["_raw"], path)
+                diff_text = f"{diff:.3%}"
+                if diff > args.tolerancia:
+                    worse.append("golden")
+            else:
+                diff_text = "ausente"
+        failures += bool(worse)
+        print(f"{card:<16} {result['p50_ms']:>7.2f}ms {result['p95_ms']:>7.2f}ms {result['bytes']:>10,} "
+              f"{result['peak_rss_mb']:>8.1f}MB {diff_text:>10}" + (f"  ❌ {', '.join(worse)}" if worse else ""))
+
+    if args.salvar_baseline:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump({
+                "limit": limit,
+                "mode": mode,
+                "repetitions": args.repeticoes,
+                "cards": {card: {m: r[m] for m in metrics} for card, r in results.items()},
+            }, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"Baseline salva em {os.path.relpath(BASELINE_PATH)}")
+    # Salvar a baseline não esconde falhas desta rodada (golden incluído)
+    return 0 if failures == 0 else 1
+
+# ========================
+# CLI
+# ========================
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks offline do bot")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p_rules = sub.add_parser("regras", help="custo por mensagem do motor de regras de moderação")
+    p_rules.add_argument("--mensagens", type=int, default=50000)
+    p_rules.add_argument("--repeticoes", type=int, default=5)
+    p_rules.set_defaults(func=bench_rules)
+
+    p_spam = sub.add_parser("spam", help="replay de fluxos de mensagens no detector de spam")
+    p_spam.add_argument("--mensagens", type=int, default=50000)
+    p_spam.add_argument("--usuarios", type=int, default=2000)
+    p_spam.set_defaults(func=bench_spam)
+
+    p_avatars = sub.add_parser("avatares", help="bytes baixados e decodificação por cartão, CDN cheio x redimensionado")
+    p_avatars.add_argument("--repeticoes", type=int, default=20)
+    p_avatars.set_defaults(func=bench_avatars)
+
+    p_encoders = sub.add_parser("codificacao", help="tempo de codificação e bytes por perfil de encoder")
+    p_encoders.add_argument("--repeticoes", type=int, default=10)
+    p_encoders.add_argument("--orcamento", type=int, default=main.DEFAULT_ENCODER_CONFIG["budget_ms"],
+                            help="orçamento em ms do perfil auto")
+    p_encoders.set_defaults(func=bench_encoders)
+
+    p_render = sub.add_parser("renderizacao", help="latência, memória, bytes e golden dos cartões contra a baseline")
+    p_render.add_argument("--repeticoes", type=int, default=30)
+    p_render.add_argument("--limite", type=float, default=None,
+                          help="piora máxima aceita sobre a baseline (0.25 = 25%%; padrão: o da baseline)")
+    p_render.add_argument("--tolerancia", type=float, default=0.001,
+                          help="fração máxima de pixels diferentes das imagens golden")
+    p_render.add_argument("--processos", action="store_true",
+                          help="renderiza no pool de processos (o pico de RSS deixa de incluir os workers)")
+    p_render.add_argument("--salvar-baseline", action="store_true", help="grava os números desta rodada como baseline")
+    p_render.add_argument("--atualizar-golden", action="store_true", help="regrava as imagens de referência")
+    p_render.set_defaults(func=bench_render)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -1,22 +1,32 @@
 import os
 import json
 import base64
+import bisect
+import gzip
+import hashlib
+import heapq
 import re
 import requests
 import time
+import zlib
 import secrets
+from array import array
 from io import BytesIO
-from threading import Thread
+from threading import Lock, Thread
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from collections import OrderedDict, deque
 from zoneinfo import ZoneInfo
-from datetime import datetime
-from functools import wraps
+from datetime import datetime, timedelta
+from functools import lru_cache, wraps
 import asyncio
 from flask import Flask, render_template, request, redirect, url_for, session, jsonify
 import discord
 from discord import app_commands
 from discord.ext import commands
 from discord import ui, Interaction, ButtonStyle
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageChops, ImageDraw, ImageFont
 
 # ========================
 # CONFIGURAÇÃO DO AMBIENTE
@@ -40,6 +50,7 @@ if not BOT_TOKEN or not GITHUB_TOKEN:
     raise SystemExit("Defina BOT_TOKEN e GITHUB_TOKEN nas variáveis de ambiente.")
 
 GITHUB_API_CONTENT = f"https://api.github.com/repos/{GITHUB_USER}/{GITHUB_REPO}/contents/{DATA_FILE}"
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
 
 # ========================
 # Sistema de ações
@@ -96,6 +107,12 @@ def load_data_from_github():
                 raw = base64.b64decode(content_b64)
                 loaded = json.loads(raw.decode("utf-8"))
                 data.update(loaded)
+                # Histórico antigo de spam, substituído pelo SpamDetector em memória
+                data.pop("last_messages_content", None)
+                activity_stats.load(data.get("activity"))
+                rebuild_config()
+                migrate_warn_timestamps()
+                warn_index.rebuild(data.get("warns", {}), cfg.warns["expire_days"] * 86400)
                 print("✅ Dados carregados do GitHub.")
                 return True
         else:
@@ -111,6 +128,7 @@ def save_data_to_github(message="Bot update"):
         if r.status_code == 200:
             sha = r.json().get("sha")
 
+        sync_state_for_save()
         content = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
         payload = {
             "message": f"{message} @ {now_br().isoformat()}",
@@ -130,6 +148,66 @@ def save_data_to_github(message="Bot update"):
         print(f"❌ Exception saving to GitHub: {e}")
     return False
 
+def _gh_archive_url(name):
+    return f"https://api.github.com/repos/{GITHUB_USER}/{GITHUB_REPO}/contents/{ARCHIVE_DIR}/{name}"
+
+def load_archive_from_github(name, strict=False):
+    """Lê um arquivo de arquivo morto (fora do documento principal) do GitHub
+
+    Retorna None se não existe ou se a leitura falhou. Com strict=True só o 404
+    vira None; outras falhas levantam RuntimeError, para quem vai reescrever o
+    arquivo não confundir erro temporário com arquivo novo.
+    """
+    try:
+        r = requests.get(_gh_archive_url(name), headers=_gh_headers(), params={"ref": BRANCH}, timeout=15)
+        if r.status_code == 200:
+            content_b64 = r.json().get("content", "")
+            if content_b64:
+                return base64.b64decode(content_b64)
+            if strict:
+                raise RuntimeError(f"{ARCHIVE_DIR}/{name} veio sem conteúdo")
+        elif r.status_code == 404:
+            return None
+        else:
+            print(f"⚠️ GitHub GET {ARCHIVE_DIR}/{name} retornou {r.status_code}")
+            if strict:
+                raise RuntimeError(f"GitHub GET {ARCHIVE_DIR}/{name} retornou {r.status_code}")
+    except RuntimeError:
+        raise
+    except Exception as e:
+        print(f"❌ Erro ao carregar {ARCHIVE_DIR}/{name}: {e}")
+        if strict:
+            raise RuntimeError(f"Erro ao carregar {ARCHIVE_DIR}/{name}: {e}") from e
+    return None
+
+def save_archive_to_github(name, raw: bytes, message="Archive update"):
+    """Grava um arquivo de arquivo morto no GitHub, separado do documento principal"""
+    try:
+        r = requests.get(_gh_archive_url(name), headers=_gh_headers(), params={"ref": BRANCH}, timeout=15)
+        sha = r.json().get("sha") if r.status_code == 200 else None
+
+        payload = {
+            "message": f"{message} @ {now_br().isoformat()}",
+            "content": base64.b64encode(raw).decode("utf-8"),
+            "branch": BRANCH
+        }
+        if sha:
+            payload["sha"] = sha
+
+        put = requests.put(_gh_archive_url(name), headers=_gh_headers(), json=payload, timeout=30)
+        if put.status_code in (200, 201):
+            print(f"✅ {ARCHIVE_DIR}/{name} salvo no GitHub.")
+            return True
+        print(f"❌ Erro ao salvar {ARCHIVE_DIR}/{name}: {put.status_code}, {put.text[:400]}")
+    except Exception as e:
+        print(f"❌ Exception saving {ARCHIVE_DIR}/{name}: {e}")
+    return False
+
+def sync_state_for_save():
+    """Copia para `data` os estados mantidos fora do dicionário antes de salvar"""
+    if activity_stats.dirty:
+        data["activity"] = activity_stats.export()
+
 def add_log(entry):
     ts = now_br().isoformat()
     data.setdefault("logs", []).append({"ts": ts, "entry": entry})
@@ -145,6 +223,865 @@ def xp_to_level(xp):
     lvl = int((xp / 100) ** 0.6) + 1
     return max(lvl, 1)
 
+# ========================
+# COOLDOWN DE XP
+# ========================
+DEFAULT_XP_COOLDOWN = 60
+DEFAULT_VOICE_XP = 10  # XP por tick de voz antes da taxa de XP
+
+class XPCooldownWheel:
+    """Timing wheel (1 slot por segundo) para o cooldown de XP por usuário.
+
+    Cada usuário premiado entra no slot do segundo atual e sai quando o
+    ponteiro dá a volta completa, então checar e expirar é O(1) amortizado
+    e a memória fica limitada aos usuários ativos dentro da janela.
+    """
+
+    def __init__(self, window: int):
+        self.window = max(0, int(window))
+        self.slots = [set() for _ in range(max(1, self.window))]
+        self.active = set()
+        self.tick = int(time.monotonic())
+
+    def _advance(self, now_tick: int):
+        steps = now_tick - self.tick
+        if steps <= 0:
+            return
+        if steps >= len(self.slots):
+            for slot in self.slots:
+                slot.clear()
+            self.active.clear()
+        else:
+            for t in range(self.tick + 1, now_tick + 1):
+                slot = self.slots[t % len(self.slots)]
+                if slot:
+                    self.active.difference_update(slot)
+                    slot.clear()
+        self.tick = now_tick
+
+    def try_acquire(self, uid: str) -> bool:
+        """Retorna True se o usuário pode ganhar XP agora (e inicia o cooldown)"""
+        if self.window == 0:
+            return True
+        self._advance(int(time.monotonic()))
+        if uid in self.active:
+            return False
+        self.slots[self.tick % len(self.slots)].add(uid)
+        self.active.add(uid)
+        return True
+
+    def __len__(self):
+        return len(self.active)
+
+xp_cooldown_wheel = XPCooldownWheel(DEFAULT_XP_COOLDOWN)
+
+# ========================
+# ESTATÍSTICAS DE ATIVIDADE
+# ========================
+ACTIVITY_HOURS = 48  # buckets horários mantidos
+ACTIVITY_DAYS = 90   # buckets diários mantidos
+
+def current_hour():
+    return int(time.time() // 3600)
+
+class ActivityRing:
+    """Contadores de mensagens e XP em buckets de hora e dia (ring buffers em array)"""
+
+    __slots__ = ("hour_msgs", "hour_xp", "day_msgs", "day_xp", "last_hour", "_encoded")
+
+    def __init__(self, last_hour=0):
+        self.hour_msgs = array("I", [0]) * ACTIVITY_HOURS
+        self.hour_xp = array("I", [0]) * ACTIVITY_HOURS
+        self.day_msgs = array("I", [0]) * ACTIVITY_DAYS
+        self.day_xp = array("I", [0]) * ACTIVITY_DAYS
+        self.last_hour = last_hour
+        self._encoded = None
+
+    def _roll(self, hour: int):
+        """Zera os buckets que ficaram para trás desde a última escrita"""
+        if hour <= self.last_hour:
+            return
+        for h in range(max(self.last_hour + 1, hour - ACTIVITY_HOURS + 1), hour + 1):
+            self.hour_msgs[h % ACTIVITY_HOURS] = 0
+            self.hour_xp[h % ACTIVITY_HOURS] = 0
+        last_day, day = self.last_hour // 24, hour // 24
+        for d in range(max(last_day + 1, day - ACTIVITY_DAYS + 1), day + 1):
+            self.day_msgs[d % ACTIVITY_DAYS] = 0
+            self.day_xp[d % ACTIVITY_DAYS] = 0
+        self.last_hour = hour
+
+    def add(self, hour: int, msgs=0, xp=0):
+        self._roll(hour)
+        if hour < self.last_hour - ACTIVITY_HOURS + 1:
+            return
+        day = hour // 24
+        if msgs:
+            self.hour_msgs[hour % ACTIVITY_HOURS] += msgs
+            self.day_msgs[day % ACTIVITY_DAYS] += msgs
+        if xp:
+            self.hour_xp[hour % ACTIVITY_HOURS] += xp
+            self.day_xp[day % ACTIVITY_DAYS] += xp
+        self._encoded = None
+
+    def daily(self, days: int, now_hour: int):
+        """Série diária (mais antiga primeiro) de (mensagens, xp) dos últimos `days` dias"""
+        today, last_day = now_hour // 24, self.last_hour // 24
+        series = []
+        for d in range(today - min(days, ACTIVITY_DAYS) + 1, today + 1):
+            if d > last_day or d <= last_day - ACTIVITY_DAYS:
+                series.append((0, 0))
+            else:
+                series.append((self.day_msgs[d % ACTIVITY_DAYS], self.day_xp[d % ACTIVITY_DAYS]))
+        return series
+
+    def trailing(self, days: int, now_hour: int):
+        series = self.daily(days, now_hour)
+        return sum(m for m, _ in series), sum(x for _, x in series)
+
+    def trailing_hours(self, hours: int, now_hour: int):
+        msgs = xp = 0
+        for h in range(now_hour - min(hours, ACTIVITY_HOURS) + 1, now_hour + 1):
+            if self.last_hour - ACTIVITY_HOURS < h <= self.last_hour:
+                msgs += self.hour_msgs[h % ACTIVITY_HOURS]
+                xp += self.hour_xp[h % ACTIVITY_HOURS]
+        return msgs, xp
+
+    def encode(self):
+        """Serializa como [última hora, base64(zlib(arrays))]"""
+        if self._encoded is None:
+            raw = b"".join(a.tobytes() for a in (self.hour_msgs, self.hour_xp, self.day_msgs, self.day_xp))
+            self._encoded = [self.last_hour, base64.b64encode(zlib.compress(raw)).decode("ascii")]
+        return self._encoded
+
+    @classmethod
+    def decode(cls, encoded):
+        ring = cls(int(encoded[0]))
+        buf = array("I")
+        buf.frombytes(zlib.decompress(base64.b64decode(encoded[1])))
+        h, d = ACTIVITY_HOURS, ACTIVITY_DAYS
+        if len(buf) == 2 * h + 2 * d:
+            ring.hour_msgs, ring.hour_xp = buf[:h], buf[h:2 * h]
+            ring.day_msgs, ring.day_xp = buf[2 * h:2 * h + d], buf[2 * h + d:]
+        return ring
+
+class ActivityStats:
+    """Atividade por membro e por canal, persistida de forma compacta em data["activity"]"""
+
+    def __init__(self):
+        self.members = {}
+        self.channels = {}
+        self.dirty = False
+
+    def record(self, uid: str, channel_id, msgs=0, xp=0):
+        hour = current_hour()
+        for table, key in ((self.members, uid), (self.channels, str(channel_id))):
+            ring = table.get(key)
+            if ring is None:
+                ring = table[key] = ActivityRing(hour)
+            ring.add(hour, msgs, xp)
+        self.dirty = True
+
+    def summary(self, days: int, member_id=None, top=5):
+        """Totais dos últimos `days` dias, top canais e série do membro (se pedido)"""
+        now_hour = current_hour()
+        channel_totals = []
+        total_msgs = total_xp = 0
+        for cid, ring in list(self.channels.items()):
+            msgs, xp = ring.trailing(days, now_hour)
+            total_msgs += msgs
+            total_xp += xp
+            if msgs or xp:
+                channel_totals.append((cid, msgs, xp))
+        channel_totals.sort(key=lambda t: t[1], reverse=True)
+
+        result = {
+            "days": days,
+            "messages": total_msgs,
+            "xp": total_xp,
+            "top_channels": [{"id": cid, "messages": m, "xp": x} for cid, m, x in channel_totals[:top]],
+        }
+        if member_id is not None:
+            ring = self.members.get(str(member_id))
+            series = ring.daily(days, now_hour) if ring else [(0, 0)] * min(days, ACTIVITY_DAYS)
+            last_24h = ring.trailing_hours(24, now_hour) if ring else (0, 0)
+            result["member"] = {
+                "id": str(member_id),
+                "messages": sum(m for m, _ in series),
+                "xp": sum(x for _, x in series),
+                "last_24h": {"messages": last_24h[0], "xp": last_24h[1]},
+                "daily": [{"messages": m, "xp": x} for m, x in series],
+            }
+        return result
+
+    def export(self):
+        self.dirty = False
+        return {
+            "members": {k: r.encode() for k, r in self.members.items()},
+            "channels": {k: r.encode() for k, r in self.channels.items()},
+        }
+
+    def load(self, stored):
+        self.members, self.channels = {}, {}
+        for attr in ("members", "channels"):
+            table = getattr(self, attr)
+            for key, encoded in (stored or {}).get(attr, {}).items():
+                try:
+                    table[key] = ActivityRing.decode(encoded)
+                except Exception as e:
+                    print(f"⚠️ Estatística de atividade inválida ({attr}/{key}): {e}")
+        self.dirty = False
+
+activity_stats = ActivityStats()
+
+# ========================
+# TEMPORADAS
+# ========================
+SEASON_ARCHIVE_CACHE_SIZE = 4
+season_archive_cache = OrderedDict()  # season_id -> SeasonStandings
+
+class SeasonStandings:
+    """Classificação já ordenada de uma temporada, com índice de posição por usuário"""
+
+    def __init__(self, season_id, rows, archived=True, meta=None):
+        self.season_id = season_id
+        self.rows = rows  # [[uid, xp, level], ...] do maior para o menor
+        self.archived = archived
+        self.meta = meta or {}
+        self.positions = {row[0]: i for i, row in enumerate(rows)}
+
+    def lookup(self, uid: str):
+        """Retorna (posição, xp, nível) do usuário na temporada"""
+        i = self.positions.get(uid)
+        if i is None:
+            return len(self.rows) + 1, 0, 1
+        _, xp, lvl = self.rows[i]
+        return i + 1, xp, lvl
+
+def current_season():
+    return data.get("season")
+
+def season_archive_name(season_id):
+    return f"season_{season_id}.json.gz"
+
+def build_standings(xp_map):
+    ranking = sorted(xp_map.items(), key=lambda t: t[1], reverse=True)
+    return [[uid, xp, xp_to_level(xp)] for uid, xp in ranking]
+
+async def archive_current_season():
+    """Congela a classificação atual em um snapshot comprimido e abre uma nova temporada
+
+    Sem temporada ativa, o snapshot arquivado (temporada 0) é o XP vitalício.
+    """
+    season = current_season()
+    season_id = season["id"] if season else 0
+    xp_map = season["xp"] if season else data.get("xp", {})
+    started = season["started"] if season else None
+    ended = now_br().isoformat()
+
+    rows = build_standings(xp_map)
+    snapshot = {"id": season_id, "started": started, "ended": ended, "standings": rows}
+    raw = gzip.compress(json.dumps(snapshot, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    name = season_archive_name(season_id)
+    if not await asyncio.to_thread(save_archive_to_github, name, raw, f"Archive season {season_id}"):
+        return None
+
+    meta = {"id": season_id, "started": started, "ended": ended, "players": len(rows)}
+    data.setdefault("season_archive", []).append(meta)
+    data["season"] = {"id": season_id + 1, "started": ended, "xp": {}}
+    season_archive_cache[season_id] = SeasonStandings(season_id, rows, meta=meta)
+    save_data_to_github(f"Start season {season_id + 1}")
+    return meta
+
+async def get_season_standings(season_id):
+    """Classificação da temporada: ao vivo para a atual, snapshot arquivado para as anteriores"""
+    season = current_season()
+    if season and season["id"] == season_id:
+        return SeasonStandings(season_id, build_standings(season["xp"]), archived=False, meta=season)
+
+    cached = season_archive_cache.get(season_id)
+    if cached:
+        season_archive_cache.move_to_end(season_id)
+        return cached
+
+    meta = next((m for m in data.get("season_archive", []) if m["id"] == season_id), None)
+    if not meta:
+        return None
+    raw = await asyncio.to_thread(load_archive_from_github, season_archive_name(season_id))
+    if raw is None:
+        return None
+    snapshot = json.loads(gzip.decompress(raw).decode("utf-8"))
+    standings = SeasonStandings(season_id, snapshot["standings"], meta=meta)
+
+    season_archive_cache[season_id] = standings
+    while len(season_archive_cache) > SEASON_ARCHIVE_CACHE_SIZE:
+        season_archive_cache.popitem(last=False)
+    return standings
+
+def get_xp_cooldown_wheel():
+    """Retorna o wheel de cooldown, recriando se a janela configurada mudou"""
+    global xp_cooldown_wheel
+    window = cfg.xp_cooldown
+    if xp_cooldown_wheel.window != window:
+        xp_cooldown_wheel = XPCooldownWheel(window)
+    return xp_cooldown_wheel
+
+MUDAE_COMMANDS = [
+    "$w", "$wa", "$wg", "$h", "$ha", "$hg",
+    "$W", "$WA", "$WG", "$H", "$HA", "$HG",
+    "$tu", "$TU", "$dk", "$mmi", "$vote", "$rolls", "$k", "$mu"
+]
+GIF_DOMAINS = ["tenor.com", "media.tenor.com", "giphy.com", "imgur.com"]
+# Grupo 1 é o host (sem usuário/senha nem porta) para as regras de domínio
+URL_RE = re.compile(r"https?://(?:[^\s/?#@]*@)?([^\s/?#:]*)[^\s]*")
+
+# ========================
+# MOTOR DE REGRAS DE MODERAÇÃO
+# ========================
+class PrefixTrie:
+    """Trie de prefixos: diz se o texto começa com algum prefixo cadastrado"""
+
+    _END = object()
+
+    def __init__(self, prefixes):
+        self.root = {}
+        for prefix in prefixes:
+            node = self.root
+            for ch in prefix:
+                node = node.setdefault(ch, {})
+            node[self._END] = True
+
+    def match(self, text: str) -> bool:
+        node = self.root
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                return False
+            if self._END in node:
+                return True
+        return False
+
+class DomainTrie:
+    """Trie de domínios por rótulos invertidos ("media.tenor.com" -> com, tenor, media)
+
+    Uma regra para "tenor.com" vale para ele e todos os subdomínios, mas não
+    para "notenor.com" nem "tenor.com.evil"; vence a regra mais específica.
+    A busca custa O(número de rótulos do host).
+    """
+
+    _VALUE = object()
+
+    def __init__(self, rules=()):
+        self.root = {}
+        self.size = 0
+        for domain, value in rules:
+            self.add(domain, value)
+
+    def add(self, domain: str, value=True):
+        node = self.root
+        for label in reversed(domain.split(".")):
+            node = node.setdefault(label, {})
+        if self._VALUE not in node:
+            self.size += 1
+        node[self._VALUE] = value
+
+    def lookup(self, host: str):
+        """Valor da regra mais específica que cobre o host, ou None"""
+        node = self.root
+        found = None
+        for label in reversed(host.split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get(self._VALUE, found)
+        return found
+
+def normalize_domain(value: str) -> str:
+    """Aceita "Tenor.com", "*.tenor.com" ou uma URL colada e devolve "tenor.com"."""
+    value = value.strip().lower()
+    match = URL_RE.match(value)
+    if match:
+        value = match.group(1)
+    return value.split("/", 1)[0].lstrip("*.").rstrip(".")
+
+class LinkPolicy:
+    """Listas de domínios permitidos/bloqueados do servidor e de cada canal
+
+    Regras do canal vencem as do servidor. Sem regra que cubra o host, o link
+    só é infração nos canais de `blocked_links_channels` (bloqueio total).
+    """
+
+    def __init__(self, link_rules: dict, blocked_channels=frozenset()):
+        link_rules = link_rules or {}
+        self.blocked_channels = blocked_channels
+        self.guild = self._build(link_rules.get("guild", {}))
+        self.channels = {}
+        for cid, rules in (link_rules.get("channels", {}) or {}).items():
+            cid = _to_int(cid)
+            if cid is not None:
+                self.channels[cid] = self._build(rules)
+        self.has_rules = bool(self.guild.size or any(t.size for t in self.channels.values()))
+
+    @staticmethod
+    def _build(rules: dict) -> DomainTrie:
+        trie = DomainTrie()
+        rules = rules or {}
+        for domain in rules.get("allow", []):
+            trie.add(domain, "allow")
+        # deny por último: se o mesmo domínio estiver nas duas listas, bloqueia
+        for domain in rules.get("deny", []):
+            trie.add(domain, "deny")
+        return trie
+
+    def violation(self, channel_id: int, hosts):
+        """Primeiro host que não é permitido no canal, ou None"""
+        blocked = channel_id in self.blocked_channels
+        if not self.has_rules:
+            return hosts[0] if blocked and hosts else None
+        channel_trie = self.channels.get(channel_id)
+        for host in hosts:
+            rule = channel_trie.lookup(host) if channel_trie is not None else None
+            if rule is None:
+                rule = self.guild.lookup(host)
+            if rule == "deny" or (rule is None and blocked):
+                return host
+        return None
+
+class MessageVerdict:
+    """Resultado da classificação de uma mensagem pelo motor de regras"""
+
+    __slots__ = ("content", "lowered", "is_bot_command", "has_media", "urls", "hosts", "link_hosts", "is_caps")
+
+    def __init__(self, content, lowered, is_bot_command, has_media, urls, hosts, link_hosts, is_caps):
+        self.content = content
+        self.lowered = lowered
+        self.is_bot_command = is_bot_command
+        self.has_media = has_media
+        self.urls = urls
+        self.hosts = hosts
+        self.link_hosts = link_hosts  # hosts que não são de GIF/mídia: só eles passam pela LinkPolicy
+        self.is_caps = is_caps
+
+class ModerationEngine:
+    """Regras de prefixo, domínio e URL compiladas uma vez e avaliadas numa única passada
+
+    Os prefixos (Mudae) ficam em uma trie; as URLs são extraídas uma vez por
+    mensagem e os hosts delas consultados na trie de domínios de GIF. A isenção
+    de mídia é por host: has_media só vale quando todo link é de mídia, senão
+    um GIF junto com outro link levaria o outro link junto.
+    """
+
+    def __init__(self, prefixes, gif_domains):
+        self.prefixes = PrefixTrie(p.lower() for p in prefixes)
+        self.gif_domains = DomainTrie((normalize_domain(d), True) for d in gif_domains)
+
+    def classify(self, content: str, attachments=(), stickers=()) -> MessageVerdict:
+        content = content.strip()
+        lowered = content.lower()
+        is_bot_command = self.prefixes.match(lowered)
+        if "://" in content:
+            urls = []
+            hosts = []
+            for match in URL_RE.finditer(lowered):
+                urls.append(content[match.start():match.end()])
+                hosts.append(match.group(1).rstrip("."))
+        else:
+            urls = hosts = []
+        link_hosts = [host for host in hosts if not self.gif_domains.lookup(host)]
+        has_media = (bool(attachments) or bool(stickers) or bool(hosts)) and not link_hosts
+        is_caps = len(content) > 5 and content.isupper()
+        return MessageVerdict(content, lowered, is_bot_command, has_media, urls, hosts, link_hosts, is_caps)
+
+def build_moderation_engine(config=None):
+    if config is None:
+        config = data.get("config", {})
+    return ModerationEngine(
+        config.get("mudae_prefixes") or MUDAE_COMMANDS,
+        config.get("gif_domains") or GIF_DOMAINS,
+    )
+
+# ========================
+# DETECÇÃO DE SPAM
+# ========================
+DEFAULT_SPAM_CONFIG = {
+    "rate_window": 10,          # segundos da janela de taxa
+    "max_messages": 6,          # mensagens permitidas na janela de taxa
+    "duplicate_window": 120,    # segundos em que repetições contam
+    "max_copies": 1,            # cópias (quase) idênticas permitidas na janela (1 = nenhuma repetição)
+    "near_matches": 6,          # mínimos iguais (de 8) no minhash para quase-repetição
+    "min_chars": 12,            # respostas curtas ("ok", "sim", "kkkk") não contam como repetição:
+    "min_words": 3,             # só entram esqueletos com min_chars letras ou textos com min_words palavras
+    "burst_window": 20,         # segundos da janela entre canais
+    "burst_channels": 3,        # canais distintos com o mesmo texto
+    "history": 10,              # mensagens guardadas por usuário
+    "idle_ttl": 600,            # segundos até esquecer um usuário ocioso
+    "max_users": 50000,         # teto de usuários acompanhados
+}
+
+_SPAM_STRIP_RE = re.compile(r"[\W_]+", re.UNICODE)
+_SPAM_REPEAT_RE = re.compile(r"(.)\1{2,}")
+
+def spam_skeleton(lowered: str) -> str:
+    """Normaliza variações triviais: pontuação, espaços e letras esticadas"""
+    return _SPAM_REPEAT_RE.sub(r"\1", _SPAM_STRIP_RE.sub("", lowered))
+
+# XOR com constante é uma permutação de 32 bits: cada sal dá uma função do minhash
+_MINHASH_SALTS = (
+    0x9E3779B9, 0x85EBCA6B, 0xC2B2AE35, 0x27D4EB2F,
+    0x165667B1, 0xD3A2646C, 0xFD7046C5, 0xB55A4F09,
+)
+
+def minhash_signature(lowered: str):
+    """Assinatura minhash sobre pares de palavras (None para textos curtos demais)"""
+    words = lowered.split()
+    if len(words) < 4:
+        return None
+    hashes = [zlib.crc32(f"{a} {b}".encode("utf-8")) for a, b in zip(words, words[1:])]
+    return tuple(min([h ^ salt for h in hashes]) for salt in _MINHASH_SALTS)
+
+class SpamDetector:
+    """Janelas deslizantes por usuário: taxa, repetição exata, quase-repetição e rajada entre canais
+
+    Cada usuário guarda um deque limitado de (ts, canal, hash do esqueleto,
+    minhash); usuários ociosos são descartados em ordem de último uso.
+    """
+
+    def __init__(self, config=None):
+        self.users = OrderedDict()
+        self.configure(config or {})
+
+    def configure(self, config: dict):
+        merged = dict(DEFAULT_SPAM_CONFIG)
+        merged.update({k: v for k, v in config.items() if k in DEFAULT_SPAM_CONFIG})
+        self.config = merged
+        self.history = int(merged["history"])
+
+    def _evict(self, now: float):
+        ttl, cap = self.config["idle_ttl"], self.config["max_users"]
+        while self.users:
+            uid, entries = next(iter(self.users.items()))
+            if len(self.users) > cap or not entries or now - entries[-1][0] > ttl:
+                self.users.popitem(last=False)
+            else:
+                break
+
+    def check(self, uid: str, channel_id: int, lowered: str, now: float = None):
+        """Registra a mensagem e retorna o motivo de spam (ou None)"""
+        now = time.time() if now is None else now
+        c = self.config
+        skeleton = spam_skeleton(lowered) or lowered
+        if len(skeleton) < c["min_chars"] and len(lowered.split()) < c["min_words"]:
+            # Curta demais para chamar de repetição: só a taxa vale para ela
+            key = sig = None
+        else:
+            key = zlib.crc32(skeleton.encode("utf-8")) if skeleton else None
+            sig = minhash_signature(lowered)
+        near = c["near_matches"]
+
+        entries = self.users.get(uid)
+        if entries is None or entries.maxlen != self.history:
+            entries = self.users[uid] = deque(entries or (), maxlen=self.history)
+        else:
+            self.users.move_to_end(uid)
+
+        recent = 0
+        duplicates = 0
+        burst_channels = {channel_id}
+        for ts, ch, k, s in entries:
+            age = now - ts
+            if age <= c["rate_window"]:
+                recent += 1
+            same = key is not None and k == key
+            if not same and sig and s:
+                same = sum(a == b for a, b in zip(sig, s)) >= near
+            if same:
+                if age <= c["duplicate_window"]:
+                    duplicates += 1
+                if age <= c["burst_window"]:
+                    burst_channels.add(ch)
+
+        entries.append((now, channel_id, key, sig))
+        self._evict(now)
+
+        if len(burst_channels) >= c["burst_channels"]:
+            return "cross_channel"
+        if duplicates + 1 > c["max_copies"]:
+            return "duplicate"
+        if recent + 1 > c["max_messages"]:
+            return "rate"
+        return None
+
+    def forget(self, uid: str):
+        self.users.pop(uid, None)
+
+    def replay(self, stream):
+        """Reproduz uma sequência de (ts, uid, canal, texto) e retorna os vereditos"""
+        return [self.check(uid, ch, text.strip().lower(), now=ts) for ts, uid, ch, text in stream]
+
+spam_detector = SpamDetector()
+
+SPAM_WARNINGS = {
+    "duplicate": "evite enviar mensagens repetidas!",
+    "rate": "evite enviar tantas mensagens em sequência!",
+    "cross_channel": "evite enviar a mesma mensagem em vários canais!",
+}
+
+# ========================
+# DETECÇÃO DE RAID
+# ========================
+DEFAULT_RAID_CONFIG = {
+    "threshold": 10,   # entradas dentro da janela que disparam o modo raid
+    "window": 30,      # segundos
+    "cooldown": 120,   # segundos sem entradas em massa para encerrar o incidente
+    "quarantine_role": None,
+}
+RAID_QUARANTINE_INTERVAL = 1.0  # segundos entre cada add_roles do lote de quarentena
+
+class RaidGuard:
+    """Janela deslizante de entradas de um servidor
+
+    Fora do modo raid guarda só as entradas da janela; ao passar do limite
+    abre um incidente com todos os membros da janela e passa a acumular as
+    próximas entradas nele até ficar `cooldown` segundos sem novas entradas.
+    """
+
+    def __init__(self):
+        self.joins = deque()  # (ts, member_id)
+        self.incident = None
+        self.task = None      # watch_raid do incidente aberto (referência evita o GC da task)
+
+    def record_join(self, member_id: int, now: float, config: dict) -> str:
+        """Classifica a entrada: "normal", "started" (acabou de abrir o incidente) ou "raid"."""
+        joins = self.joins
+        joins.append((now, member_id))
+        cutoff = now - config["window"]
+        while joins and joins[0][0] < cutoff:
+            joins.popleft()
+
+        if self.incident is not None:
+            self.incident["members"].append(member_id)
+            self.incident["last_join"] = now
+            return "raid"
+
+        if len(joins) >= config["threshold"]:
+            self.incident = {
+                "started": now,
+                "started_at": now_br().isoformat(),
+                "last_join": now,
+                "members": [mid for _, mid in joins],
+            }
+            return "started"
+        return "normal"
+
+    def expired(self, now: float, config: dict) -> bool:
+        return self.incident is not None and now - self.incident["last_join"] >= config["cooldown"]
+
+    def close(self):
+        incident, self.incident = self.incident, None
+        self.joins.clear()
+        return incident
+
+raid_guards = {}
+
+def get_raid_guard(guild_id: int) -> RaidGuard:
+    guard = raid_guards.get(guild_id)
+    if guard is None:
+        guard = raid_guards[guild_id] = RaidGuard()
+    return guard
+
+# ========================
+# CONFIGURAÇÃO COMPILADA
+# ========================
+DEFAULT_WELCOME_MESSAGE = "Olá {member}, seja bem-vindo(a)!"
+# Usados só enquanto nenhum cargo de staff foi configurado por ID
+STAFF_ROLE_NAMES = {"Administrador", "Moderador"}
+# Escalonamento de advertências; 0 desliga a etapa
+DEFAULT_WARN_CONFIG = {
+    "expire_days": 7,       # advertência deixa de contar (e vai para o arquivo) depois disso
+    "timeout_at": 0,        # advertências ativas para castigo (timeout); 0 = desligado até o admin ligar
+    "timeout_minutes": 60,
+    "kick_at": 0,           # advertências ativas para expulsão; 0 = desligado
+}
+
+# Codificação dos cartões gerados. "auto" testa os perfis de AUTO_ENCODER_ORDER
+# e fica com o menor arquivo que couber no orçamento de CPU (budget_ms).
+ENCODER_PROFILES = ("png", "png_optimized", "palette", "webp", "jpeg", "auto")
+AUTO_ENCODER_ORDER = ("palette", "webp", "png_optimized")
+DEFAULT_ENCODER_CONFIG = {
+    "profile": "png",
+    "compress_level": 9,    # 0-9, perfis png_optimized e palette
+    "colors": 256,          # 2-256, perfil palette
+    "quality": 85,          # 1-100, perfis webp e jpeg
+    "budget_ms": 40,        # tempo máximo de codificação por cartão no modo auto
+}
+
+def normalize_encoder_config(raw) -> dict:
+    """Perfil de codificação com valores fora da faixa trazidos para dentro dela"""
+    raw = raw or {}
+    encoder = dict(DEFAULT_ENCODER_CONFIG)
+    if raw.get("profile") in ENCODER_PROFILES:
+        encoder["profile"] = raw["profile"]
+    for key, low, high in (("compress_level", 0, 9), ("colors", 2, 256), ("quality", 1, 100), ("budget_ms", 1, 1000)):
+        value = _to_int(raw.get(key))
+        if value is not None:
+            encoder[key] = min(high, max(low, value))
+    return encoder
+
+def _to_int(value):
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+class CompiledConfig:
+    """Snapshot imutável da configuração já convertida para uso nos handlers
+
+    IDs viram int, listas de canais viram frozenset e canais/cargos já vêm
+    resolvidos; é reconstruído por inteiro (rebuild_config) a cada mudança.
+    """
+
+    def __init__(self, source: dict, guild=None):
+        config = source.get("config", {}) or {}
+
+        self.xp_rate = max(1, _to_int(config.get("xp_rate")) or 3)
+        self.xp_gain = max(1, xp_for_message() // self.xp_rate)
+        cooldown = _to_int(config.get("xp_cooldown"))
+        self.xp_cooldown = DEFAULT_XP_COOLDOWN if cooldown is None else max(0, cooldown)
+        voice_xp = _to_int(config.get("voice_xp"))
+        self.voice_xp = DEFAULT_VOICE_XP if voice_xp is None else max(0, voice_xp)
+
+        self.welcome_channel_id = _to_int(config.get("welcome_channel"))
+        self.levelup_channel_id = _to_int(config.get("levelup_channel"))
+        self.logs_channel_id = _to_int(config.get("logs_channel"))
+        self.welcome_background = config.get("welcome_background", "") or ""
+        self.welcome_parts = tuple((config.get("welcome_message") or DEFAULT_WELCOME_MESSAGE).split("{member}"))
+
+        self.blocked_link_channels = frozenset(
+            cid for cid in map(_to_int, source.get("blocked_links_channels", [])) if cid is not None
+        )
+        self.command_channels = {
+            name: frozenset(cid for cid in map(_to_int, channels) if cid is not None)
+            for name, channels in (source.get("command_channels", {}) or {}).items()
+        }
+        self.level_role_ids = {
+            lvl: rid for lvl, rid in (
+                (_to_int(k), _to_int(v)) for k, v in (source.get("level_roles", {}) or {}).items()
+            ) if lvl is not None and rid is not None
+        }
+
+        self.engine = build_moderation_engine(config)
+        self.link_policy = LinkPolicy(config.get("link_rules"), self.blocked_link_channels)
+        pipeline = config.get("channel_pipeline", {}) or {}
+        self.xp_off_channels = frozenset(
+            cid for cid, opts in ((_to_int(k), v) for k, v in pipeline.items())
+            if cid is not None and not opts.get("xp", True)
+        )
+        self.moderation_off_channels = frozenset(
+            cid for cid, opts in ((_to_int(k), v) for k, v in pipeline.items())
+            if cid is not None and not opts.get("moderation", True)
+        )
+        self.spam = dict(DEFAULT_SPAM_CONFIG)
+        self.spam.update(config.get("spam", {}) or {})
+        raid = config.get("raid", {}) or {}
+        self.raid = {
+            key: max(1, _to_int(raid.get(key)) or default)
+            for key, default in DEFAULT_RAID_CONFIG.items() if key != "quarantine_role"
+        }
+        self.quarantine_role_id = _to_int(raid.get("quarantine_role"))
+        warns = config.get("warns", {}) or {}
+        self.warns = {}
+        for key, default in DEFAULT_WARN_CONFIG.items():
+            value = _to_int(warns.get(key))
+            self.warns[key] = default if value is None else max(0, value)
+        self.warns["expire_days"] = max(1, self.warns["expire_days"])
+        self.encoder = normalize_encoder_config(config.get("encoder"))
+        # Templates de cartão personalizados em JSON canônico (ausente = template padrão)
+        # e um resumo curto de cada um, que entra na chave do cache de cartões
+        self.card_templates = {
+            name: json.dumps(template, sort_keys=True, ensure_ascii=False)
+            for name, template in (config.get("card_templates", {}) or {}).items()
+        }
+        self.card_themes = {
+            name: hashlib.sha1(tpl.encode()).hexdigest()[:12] for name, tpl in self.card_templates.items()
+        }
+
+        # Objetos resolvidos (None enquanto o bot não está pronto)
+        self.guild = guild
+        self.welcome_channel = guild.get_channel(self.welcome_channel_id) if guild and self.welcome_channel_id else None
+        self.levelup_channel = guild.get_channel(self.levelup_channel_id) if guild and self.levelup_channel_id else None
+        self.logs_channel = guild.get_channel(self.logs_channel_id) if guild and self.logs_channel_id else None
+        self.quarantine_role = guild.get_role(self.quarantine_role_id) if guild and self.quarantine_role_id else None
+        self.level_roles = {}
+        if guild:
+            for lvl, rid in self.level_role_ids.items():
+                role = guild.get_role(rid)
+                if role:
+                    self.level_roles[lvl] = role
+
+        staff_ids = frozenset(rid for rid in map(_to_int, config.get("staff_roles", [])) if rid is not None)
+        if not staff_ids and guild:
+            staff_ids = frozenset(r.id for r in guild.roles if r.name in STAFF_ROLE_NAMES)
+        self.staff_role_ids = staff_ids
+        self.staff_by_name = not config.get("staff_roles")
+
+    def format_welcome(self, mention: str) -> str:
+        return mention.join(self.welcome_parts)
+
+    def channel_allowed(self, command_name: str, channel_id: int) -> bool:
+        allowed = self.command_channels.get(command_name)
+        return not allowed or channel_id in allowed
+
+cfg = CompiledConfig({})
+
+class MemberFlagsCache:
+    """Cache por (servidor, membro) de (é staff, é admin), invalidado quando cargos mudam
+
+    Staff é decidido pelos IDs de cargo do snapshot de configuração (ou pelos
+    nomes em STAFF_ROLE_NAMES se não há staff_roles nem guild resolvida para
+    traduzir os nomes em IDs); admin pelas permissões do servidor. No caminho
+    quente é um único dict lookup. A chave inclui o servidor: sem GUILD_ID o
+    bot atende vários, e admin em um não pode virar admin nos outros.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, member):
+        if not isinstance(member, discord.Member):
+            # discord.User (fora do servidor) não tem cargos nem permissões
+            return (False, False)
+        key = (member.guild.id, member.id)
+        flags = self.entries.get(key)
+        if flags is not None:
+            return flags
+        if cfg.staff_by_name and cfg.guild is None:
+            is_staff = any(r.name in STAFF_ROLE_NAMES for r in member.roles)
+        else:
+            staff_ids = cfg.staff_role_ids
+            is_staff = any(r.id in staff_ids for r in member.roles)
+        perms = member.guild_permissions
+        is_admin = perms.administrator or perms.manage_guild or perms.manage_roles
+        flags = self.entries[key] = (is_staff, is_admin)
+        return flags
+
+    def invalidate(self, guild_id: int, member_id: int):
+        self.entries.pop((guild_id, member_id), None)
+
+    def clear(self):
+        self.entries.clear()
+
+member_flags = MemberFlagsCache()
+
+def rebuild_config():
+    """Recompila a configuração e troca o snapshot de uma vez (atômico para os handlers)"""
+    global cfg
+    guild = bot.get_guild(int(GUILD_ID)) if GUILD_ID and bot.is_ready() else None
+    cfg = CompiledConfig(data, guild)
+    spam_detector.configure(cfg.spam)
+    member_flags.clear()
+    if warn_index.window != cfg.warns["expire_days"] * 86400:
+        warn_index.rebuild(data.get("warns", {}), cfg.warns["expire_days"] * 86400)
+    return cfg
+
 EMOJI_RE = re.compile(r"<a?:([a-zA-Z0-9_]+):([0-9]+)>")
 EMOJI_NAME_RE = re.compile(r":([a-zA-Z0-9_]+):")
 
@@ -386,15 +1323,11 @@ async def execute_bot_action_internal(action):
                 await channel.send(content=mention_text, embed=embed)
                 print(f"✅ Embed enviada com sucesso para #{channel.name}")
                 
-                # Log no canal de logs se configurado
-                logs_channel_id = data.get("config", {}).get("logs_channel")
-                if logs_channel_id:
-                    logs_channel = guild.get_channel(int(logs_channel_id))
-                    if logs_channel:
-                        await logs_channel.send(
-                            f"📝 Embed criada por {action_data.get('admin', 'Site Admin')} em #{channel.name}\n"
-                            f"Título: {action_data['title'][:100]}"
-                        )
+                # Entra no próximo resumo do canal de logs
+                modlog.emit(
+                    "embed", f"#{channel.name}", action_data["title"][:100],
+                    actor=action_data.get('admin', 'Site Admin'), channel=channel.id
+                )
                 
                 return True
                 
@@ -645,26 +1578,11 @@ async def execute_bot_action_internal(action):
                 print(f"✅ Membro: {member.display_name}")
                 print(f"📝 Motivo: {action_data['reason']}")
                 
-                # Adiciona advertência
-                entry = {
-                    "by": "site_admin",
-                    "reason": action_data["reason"],
-                    "ts": now_br().strftime("%d/%m/%Y %H:%M"),
-                    "admin": action_data.get('admin', 'Site Admin')
-                }
-                data.setdefault("warns", {}).setdefault(str(member.id), []).append(entry)
-                save_data_to_github(f"Warn via site: {member.display_name}")
-                
-                # Envia mensagem no canal de logs, se configurado
-                logs_channel_id = data.get("config", {}).get("logs_channel")
-                if logs_channel_id:
-                    logs_channel = guild.get_channel(int(logs_channel_id))
-                    if logs_channel:
-                        await logs_channel.send(
-                            f"⚠️ {member.mention} foi advertido por {action_data.get('admin', 'Site Admin')}.\n"
-                            f"Motivo: {action_data['reason']}"
-                        )
-                        print(f"📝 Log enviado para #{logs_channel.name}")
+                # Advertência manual é crítica: o resumo sai na hora (e salva)
+                await add_warn(
+                    member, action_data["reason"], actor="site_admin", critical=True,
+                    admin=action_data.get('admin', 'Site Admin')
+                )
                 
                 print(f"✅ Membro advertido: {member.display_name}")
                 return True
@@ -1122,6 +2040,7 @@ def dashboard():
     config = data.get("config", {})
     welcome_msg = config.get("welcome_message", "Olá {member}, seja bem-vindo(a)!")
     xp_rate = config.get("xp_rate", 3)
+    xp_cooldown = config.get("xp_cooldown", DEFAULT_XP_COOLDOWN)
     welcome_bg = config.get("welcome_background", "")
     welcome_chan = config.get("welcome_channel", "")
     levelup_chan = config.get("levelup_channel", "")
@@ -1514,6 +2433,11 @@ def dashboard():
                         <input type="number" id="xp-rate" class="form-control" value="''' + str(xp_rate) + '''" min="1" max="10">
                         <small>1 = fácil, 10 = muito difícil</small>
                     </div>
+                    <div class="form-group">
+                        <label>Cooldown de XP (segundos)</label>
+                        <input type="number" id="xp-cooldown" class="form-control" value="''' + str(xp_cooldown) + '''" min="0" max="3600">
+                        <small>Intervalo mínimo entre ganhos de XP por usuário (0 = sem cooldown)</small>
+                    </div>
                     <div class="form-group">
                         <label>Canal de Level Up</label>
                         <select id="levelup-channel" class="form-control">
@@ -1944,6 +2868,7 @@ def dashboard():
             async function saveXPConfig() {
                 const data = {
                     rate: parseInt(document.getElementById('xp-rate').value),
+                    cooldown: parseInt(document.getElementById('xp-cooldown').value),
                     channel_id: document.getElementById('levelup-channel').value
                 };
                 
@@ -2584,8 +3509,12 @@ def api_config_welcome():
         if 'image_url' in req_data:
             config["welcome_background"] = req_data['image_url']
         
+        rebuild_config()
         success = save_data_to_github("Config boas-vindas via site")
-        return jsonify({"success": success, "message": "Configuração salva!"})
+        message = "Configuração salva!"
+        if cfg.welcome_background and not welcome_bg_cache.refresh(cfg.welcome_background, force=True):
+            message += " ⚠️ Não foi possível baixar a imagem de fundo."
+        return jsonify({"success": success, "message": message})
         
     except Exception as e:
         return jsonify({"success": False, "message": f"Erro: {str(e)}"}), 500
@@ -2605,15 +3534,143 @@ def api_config_xp():
             if 1 <= rate <= 10:
                 config["xp_rate"] = rate
         
+        if 'cooldown' in req_data:
+            cooldown = int(req_data['cooldown'])
+            if 0 <= cooldown <= 3600:
+                config["xp_cooldown"] = cooldown
+        
         if 'channel_id' in req_data:
             config["levelup_channel"] = req_data['channel_id']
         
+        rebuild_config()
         success = save_data_to_github("Config XP via site")
         return jsonify({"success": success, "message": "Configuração de XP salva!"})
         
     except Exception as e:
         return jsonify({"success": False, "message": f"Erro: {str(e)}"}), 500
 
+@app.route("/api/config/spam", methods=["GET", "POST"])
+def api_config_spam():
+    """API para ver/ajustar os limites da detecção de spam"""
+    if 'user' not in session:
+        return jsonify({"success": False, "message": "Não autenticado"}), 401
+    
+    try:
+        if request.method == "GET":
+            return jsonify({"success": True, "spam": cfg.spam, "tracked_users": len(spam_detector.users)})
+        
+        req_data = request.json or {}
+        spam_config = data.setdefault("config", {}).setdefault("spam", {})
+        for key, value in req_data.items():
+            if key in DEFAULT_SPAM_CONFIG:
+                value = int(value)
+                if value < 0:
+                    return jsonify({"success": False, "message": f"Valor inválido para {key}"})
+                spam_config[key] = value
+        
+        rebuild_config()
+        success = save_data_to_github("Config spam via site")
+        return jsonify({"success": success, "message": "Configuração de spam salva!", "spam": cfg.spam})
+        
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Erro: {str(e)}"}), 500
+
+def update_link_rule(domain: str, action: str, channel_id=None) -> str:
+    """Inclui/remove um domínio nas listas de links do servidor ou de um canal; retorna o domínio normalizado"""
+    domain = normalize_domain(domain)
+    if not domain or action not in ("allow", "deny", "remove"):
+        raise ValueError("Domínio ou ação inválidos")
+
+    link_rules = data.setdefault("config", {}).setdefault("link_rules", {})
+    if channel_id:
+        rules = link_rules.setdefault("channels", {}).setdefault(str(channel_id), {})
+    else:
+        rules = link_rules.setdefault("guild", {})
+    for key in ("allow", "deny"):
+        domains = rules.setdefault(key, [])
+        if domain in domains:
+            domains.remove(domain)
+    if action != "remove":
+        rules[action].append(domain)
+
+    rebuild_config()
+    return domain
+
+@app.route("/api/config/warns", methods=["GET", "POST"])
+def api_config_warns():
+    """API para ver/ajustar o escalonamento e o vencimento das advertências"""
+    if 'user' not in session:
+        return jsonify({"success": False, "message": "Não autenticado"}), 401
+    
+    try:
+        if request.method == "GET":
+            return jsonify({"success": True, "warns": cfg.warns, "active_members": len(warn_index.active)})
+        
+        req_data = request.json or {}
+        warn_config = data.setdefault("config", {}).setdefault("warns", {})
+        for key, value in req_data.items():
+            if key in DEFAULT_WARN_CONFIG:
+                value = int(value)
+                if value < 0:
+                    return jsonify({"success": False, "message": f"Valor inválido para {key}"})
+                warn_config[key] = value
+        
+        # Mudar expire_days reconstrói o índice de advertências, que é do event loop
+        async def rebuild_on_loop():
+            rebuild_config()
+        
+        asyncio.run_coroutine_threadsafe(rebuild_on_loop(), bot.loop).result(timeout=15)
+        success = save_data_to_github("Config warns via site")
+        return jsonify({"success": success, "message": "Escalonamento de advertências salvo!", "warns": cfg.warns})
+        
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Erro: {str(e)}"}), 500
+
+@app.route("/api/config/encoder", methods=["GET", "POST"])
+def api_config_encoder():
+    """API para o perfil de codificação dos cartões gerados"""
+    if 'user' not in session:
+        return jsonify({"success": False, "message": "Não autenticado"}), 401
+    
+    try:
+        if request.method == "GET":
+            return jsonify({"success": True, "encoder": cfg.encoder, "profiles": ENCODER_PROFILES})
+        
+        req_data = request.json or {}
+        if "profile" in req_data and req_data["profile"] not in ENCODER_PROFILES:
+            return jsonify({"success": False, "message": f"Perfil deve ser um de: {', '.join(ENCODER_PROFILES)}"})
+        encoder = data.setdefault("config", {}).setdefault("encoder", {})
+        encoder.update({k: v for k, v in req_data.items() if k in DEFAULT_ENCODER_CONFIG})
+        data["config"]["encoder"] = normalize_encoder_config(encoder)
+        
+        rebuild_config()
+        success = save_data_to_github("Config encoder via site")
+        return jsonify({"success": success, "message": "Perfil de codificação salvo!", "encoder": cfg.encoder})
+        
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Erro: {str(e)}"}), 500
+
+@app.route("/api/config/link-rules", methods=["GET", "POST"])
+def api_config_link_rules():
+    """API para as listas de domínios permitidos/bloqueados"""
+    if 'user' not in session:
+        return jsonify({"success": False, "message": "Não autenticado"}), 401
+    
+    try:
+        if request.method == "GET":
+            return jsonify({"success": True, "link_rules": data.get("config", {}).get("link_rules", {})})
+        
+        req_data = request.json or {}
+        domain = update_link_rule(req_data.get("domain", ""), req_data.get("action", ""), req_data.get("channel_id"))
+        success = save_data_to_github(f"Link rule {domain} via site")
+        return jsonify({"success": success, "message": f"Regra de {domain} salva!",
+                        "link_rules": data["config"]["link_rules"]})
+        
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)})
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Erro: {str(e)}"}), 500
+
 @app.route("/api/level-roles", methods=["GET", "POST", "DELETE"])
 def api_level_roles():
     """API para cargos por nível"""
@@ -2634,6 +3691,7 @@ def api_level_roles():
                 return jsonify({"success": False, "message": "Nível e cargo são obrigatórios"})
             
             data.setdefault("level_roles", {})[level] = role_id
+            rebuild_config()
             save_data_to_github(f"Add level role {level}")
             return jsonify({"success": True, "message": f"Cargo definido para nível {level}"})
         
@@ -2644,6 +3702,7 @@ def api_level_roles():
             
             if level in data.get("level_roles", {}):
                 del data["level_roles"][level]
+                rebuild_config()
                 save_data_to_github(f"Remove level role {level}")
                 return jsonify({"success": True, "message": f"Cargo removido do nível {level}"})
             else:
@@ -2732,8 +3791,11 @@ def api_command_clearwarns():
         if not member_id:
             return jsonify({"success": False, "message": "ID do membro é obrigatório"})
         
-        if member_id in data.get("warns", {}):
-            data["warns"].pop(member_id)
+        # O índice de advertências é mexido pelo event loop: a limpeza roda lá também
+        async def clear_on_loop():
+            return clear_warns(member_id)
+        
+        if asyncio.run_coroutine_threadsafe(clear_on_loop(), bot.loop).result(timeout=15):
             save_data_to_github(f"Clear warns via site: {member_id}")
             return jsonify({"success": True, "message": "✅ Advertências removidas!"})
         else:
@@ -2801,6 +3863,7 @@ def api_command_blocklinks():
             blocked.append(int(channel_id))
             message = "✅ Links bloqueados neste canal"
         
+        rebuild_config()
         save_data_to_github("Toggle block links via site")
         
         return jsonify({"success": True, "message": message})
@@ -2879,6 +3942,105 @@ def api_command_channels():
     command_channels = data.get("command_channels", {})
     return jsonify({"success": True, "command_channels": command_channels})
 
+@app.route("/api/stats/activity")
+def api_stats_activity():
+    """API de atividade dos últimos 7/30/90 dias (totais, top canais e membro)"""
+    if 'user' not in session:
+        return jsonify({"success": False, "message": "Não autenticado"}), 401
+    
+    try:
+        days = int(request.args.get('days', 7))
+        if days not in (7, 30, 90):
+            return jsonify({"success": False, "message": "Use days=7, 30 ou 90"})
+        top = min(int(request.args.get('top', 5)), 25)
+        member_id = request.args.get('member_id')
+        
+        summary = activity_stats.summary(days, member_id=member_id, top=top)
+        
+        guild = bot.get_guild(int(GUILD_ID)) if GUILD_ID and bot.is_ready() else None
+        if guild:
+            for entry in summary["top_channels"]:
+                channel = guild.get_channel(int(entry["id"]))
+                entry["name"] = channel.name if channel else None
+        
+        return jsonify({"success": True, "activity": summary})
+        
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Erro: {str(e)}"}), 500
+
+@app.route("/api/stats/pipeline", methods=["GET", "DELETE"])
+def api_stats_pipeline():
+    """API com a latência por etapa do on_message (DELETE zera as métricas)"""
+    if 'user' not in session:
+        return jsonify({"success": False, "message": "Não autenticado"}), 401
+    
+    if request.method == "DELETE":
+        pipeline_metrics.reset()
+        return jsonify({"success": True, "message": "Métricas zeradas"})
+    return jsonify({"success": True, "pipeline": pipeline_metrics.summary(), "render": render_service.stats(),
+                    "avatar_cache": avatar_cache.stats(),
+                    "rank_card_cache": rank_card_cache.stats(),
+                    "leaderboard_cache": leaderboard_cache.stats()})
+
+@app.route("/api/config/channel-pipeline", methods=["GET", "POST"])
+def api_config_channel_pipeline():
+    """API para desligar XP e/ou moderação por canal"""
+    if 'user' not in session:
+        return jsonify({"success": False, "message": "Não autenticado"}), 401
+    
+    try:
+        if request.method == "GET":
+            return jsonify({"success": True, "channel_pipeline": data.get("config", {}).get("channel_pipeline", {})})
+        
+        req_data = request.json or {}
+        channel_id = req_data.get("channel_id")
+        if not channel_id:
+            return jsonify({"success": False, "message": "ID do canal é obrigatório"})
+        
+        set_channel_pipeline(channel_id, bool(req_data.get("xp", True)), bool(req_data.get("moderation", True)))
+        success = save_data_to_github("Channel pipeline via site")
+        return jsonify({"success": success, "message": "Etapas do canal salvas!",
+                        "channel_pipeline": data["config"].get("channel_pipeline", {})})
+        
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Erro: {str(e)}"}), 500
+
+@app.route("/api/config/card-template", methods=["GET", "POST"])
+def api_config_card_template():
+    """API para personalizar o layout dos cartões de boas-vindas e de rank"""
+    if 'user' not in session:
+        return jsonify({"success": False, "message": "Não autenticado"}), 401
+    
+    try:
+        if request.method == "GET":
+            custom = data.get("config", {}).get("card_templates", {})
+            return jsonify({"success": True, "defaults": DEFAULT_CARD_TEMPLATES, "card_templates": custom})
+        
+        req_data = request.json or {}
+        card = req_data.get("card")
+        if card not in DEFAULT_CARD_TEMPLATES:
+            return jsonify({"success": False, "message": "Cartão deve ser 'welcome' ou 'rank'"})
+        
+        templates = data.setdefault("config", {}).setdefault("card_templates", {})
+        if req_data.get("reset"):
+            templates.pop(card, None)
+            message = "Template padrão restaurado!"
+        else:
+            template = req_data.get("template")
+            try:
+                validate_card_template(template, card)
+            except (ValueError, KeyError, TypeError, IndexError) as e:
+                return jsonify({"success": False, "message": f"Template inválido: {e}"})
+            templates[card] = template
+            message = "Template salvo!"
+        
+        rebuild_config()
+        success = save_data_to_github(f"Card template {card} via site")
+        return jsonify({"success": success, "message": message})
+        
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Erro: {str(e)}"}), 500
+
 @app.route("/api/test/bot", methods=["GET"])
 def api_test_bot():
     """API para testar conexão com o bot"""
@@ -3056,36 +4218,755 @@ def auto_ping():
         except Exception as e:
             print(f"Erro no auto-ping: {e}")
 
-Thread(target=auto_ping, daemon=True).start()
 
 # ========================
-# EVENTOS DO BOT
+# RENDERIZAÇÃO DE CARTÕES
 # ========================
-@bot.event
-async def on_ready():
-    bot.start_time = datetime.now()
-    
-    print(f"\n{'='*50}")
-    print(f"🤖 BOT INICIADO COM SUCESSO!")
-    print(f"{'='*50}")
-    print(f"📛 Nome: {bot.user}")
-    print(f"🆔 ID: {bot.user.id}")
-    print(f"✅ Status: {'PRONTO' if bot.is_ready() else 'NÃO PRONTO'}")
-    print(f"{'='*50}")
-    
-    print(f"🏠 GUILDS CONECTADAS ({len(bot.guilds)}):")
-    for i, guild in enumerate(bot.guilds, 1):
-        print(f"  {i}. {guild.name} (ID: {guild.id}) - Membros: {len(guild.members)}")
-    print(f"{'='*50}")
-    
-    target_guild = None
-    if GUILD_ID:
-        target_guild = bot.get_guild(int(GUILD_ID))
-        if target_guild:
-            print(f"🎯 GUILD ALVO ENCONTRADA:")
-            print(f"   Nome: {target_guild.name}")
-            print(f"   ID: {target_guild.id}")
-            print(f"   👥 Membros: {len(target_guild.members)}")
+FONT_BOLD = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+FONT_REGULAR = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", 2))
+RENDER_MAX_PENDING = int(os.getenv("RENDER_MAX_PENDING", 8))   # renders em andamento + na fila
+RENDER_QUEUE_TIMEOUT = 10  # segundos esperando vaga antes de desistir
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+AVATAR_CACHE_BYTES = int(os.getenv("AVATAR_CACHE_BYTES", 32 * 1024 * 1024))
+RANK_CARD_CACHE_BYTES = int(os.getenv("RANK_CARD_CACHE_BYTES", 16 * 1024 * 1024))
+LEADERBOARD_CACHE_BYTES = int(os.getenv("LEADERBOARD_CACHE_BYTES", 8 * 1024 * 1024))
+WELCOME_BG_TTL = int(os.getenv("WELCOME_BG_TTL", 24 * 3600))  # segundos até buscar a URL de novo
+WELCOME_BG_RETRY = 60  # segundos até tentar de novo uma URL que falhou (dobra a cada falha, até o TTL)
+
+WELCOME_SIZE = (900, 300)
+WELCOME_AVATAR = 150
+WELCOME_BORDER = 5
+WELCOME_UPSCALE = 4   # o avatar é montado 4x maior e reduzido com LANCZOS (borda suave)
+WELCOME_BORDER_COLOR = (200, 150, 255, 255)
+RANK_AVATAR = 120
+LEADERBOARD_PAGE = 10
+LEADERBOARD_WIDTH = 900
+LEADERBOARD_HEADER = 80
+LEADERBOARD_ROW = 64
+LEADERBOARD_AVATAR = 52
+LEADERBOARD_FETCH_CONCURRENCY = 5   # downloads de avatar simultâneos por pedido
+LEADERBOARD_AVATAR_TIMEOUT = 2.0    # segundos esperando avatares frios antes de renderizar sem eles
+
+# Assets estáticos: cada processo de render carrega uma vez (lru_cache) e os
+# reaproveita; quem recebe um Image do cache não pode alterá-lo (use .copy()).
+@lru_cache(maxsize=None)
+def _load_font(path, size):
+    try:
+        return ImageFont.truetype(path, size)
+    except Exception:
+        return ImageFont.load_default()
+
+@lru_cache(maxsize=None)
+def circle_mask(size: int):
+    mask = Image.new("L", (size, size), 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, size, size), fill=255)
+    return mask
+
+@lru_cache(maxsize=None)
+def border_disc(size: int, color: tuple):
+    """Disco cheio da cor da borda; o avatar é colado por cima deixando só o anel"""
+    border = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    ImageDraw.Draw(border).ellipse((0, 0, size, size), fill=color)
+    return border
+
+# ========================
+# TEMPLATES DE CARTÕES
+# ========================
+# Um template é uma lista de camadas desenhadas em ordem. Camadas estáticas
+# (fundo, overlay, molduras, textos fixos) são rasterizadas uma vez por
+# template em template_base(); por pedido só entram as dinâmicas: avatar,
+# textos com {campo} e a barra de progresso. Estáticas ficam sempre por baixo
+# das dinâmicas. Campos: name, count_text, position, level, xp, cur, next_xp.
+_SHADOW = {"dx": 2, "dy": 2, "color": [0, 0, 0, 180]}
+
+DEFAULT_CARD_TEMPLATES = {
+    "welcome": {
+        "size": [900, 300],
+        "background": [0, 0, 0, 255],
+        "layers": [
+            {"type": "background_image"},
+            {"type": "overlay", "color": [50, 50, 50, 150]},
+            {"type": "avatar", "kind": "welcome", "x": "center", "y": 30},
+            {"type": "text", "text": "{name}", "font": "bold", "size": 36, "color": [200, 150, 255],
+             "x": "center", "y": 200, "shadow": _SHADOW},
+            {"type": "text", "text": "{count_text}", "font": "regular", "size": 24, "color": [200, 150, 255],
+             "x": "center", "y": 250, "shadow": dict(_SHADOW, dx=1, dy=1)},
+        ],
+    },
+    "rank": {
+        "size": [900, 200],
+        "background": [0, 0, 0, 255],
+        "layers": [
+            {"type": "rounded_rect", "box": [160, 140, 560, 36], "radius": 18, "color": [50, 50, 50]},
+            {"type": "avatar", "kind": "rank", "x": 20, "y": 40},
+            {"type": "text", "text": "{name}", "font": "bold", "size": 32, "color": [0, 255, 255], "x": 160, "y": 50},
+            {"type": "text", "text": "CLASSIFICAÇÃO #{position}", "font": "regular", "size": 22,
+             "color": [0, 255, 255], "x": 680, "y": 40},
+            {"type": "text", "text": "NÍVEL {level}", "font": "regular", "size": 22, "color": [255, 0, 255], "x": 680, "y": 80},
+            {"type": "progress_bar", "box": [160, 140, 560, 36], "radius": 18, "color": [0, 200, 255]},
+            {"type": "text", "text": "{cur} / {next_xp} XP", "font": "regular", "size": 22, "color": [255, 255, 255],
+             "box": [160, 140, 560, 36]},
+        ],
+    },
+}
+
+CARD_FONTS = {"bold": FONT_BOLD, "regular": FONT_REGULAR}
+STATIC_LAYERS = {"background_image", "overlay", "rect", "rounded_rect"}
+DYNAMIC_LAYERS = {"avatar", "progress_bar"}
+
+def template_json(template: dict) -> str:
+    """Forma canônica do template: é a chave dos caches e o que vai para os workers"""
+    return json.dumps(template, sort_keys=True, ensure_ascii=False)
+
+DEFAULT_TEMPLATE_JSON = {name: template_json(t) for name, t in DEFAULT_CARD_TEMPLATES.items()}
+
+def _is_dynamic(layer: dict) -> bool:
+    return layer["type"] in DYNAMIC_LAYERS or (layer["type"] == "text" and "{" in layer["text"])
+
+def validate_card_template(template: dict, card: str):
+    """Levanta ValueError se o template não puder ser desenhado"""
+    if not isinstance(template, dict) or not isinstance(template.get("layers"), list):
+        raise ValueError("Template precisa de uma lista 'layers'")
+    size = template.get("size")
+    if not (isinstance(size, list) and len(size) == 2 and all(isinstance(v, int) and 16 <= v <= 2048 for v in size)):
+        raise ValueError("'size' deve ser [largura, altura] entre 16 e 2048")
+    for layer in template["layers"]:
+        kind = layer.get("type") if isinstance(layer, dict) else None
+        if kind not in STATIC_LAYERS and kind not in DYNAMIC_LAYERS and kind != "text":
+            raise ValueError(f"Camada desconhecida: {kind}")
+        if kind == "text":
+            if layer.get("font", "regular") not in CARD_FONTS:
+                raise ValueError("Fonte deve ser 'bold' ou 'regular'")
+            if not isinstance(layer.get("text"), str):
+                raise ValueError("Camada de texto precisa de 'text'")
+        if kind == "avatar" and layer.get("kind") != card:
+            raise ValueError(f"Avatar do cartão {card} deve usar kind={card}")
+    # Renderiza um exemplo para pegar campos inexistentes e valores inválidos
+    render_card(template_json(template), {
+        "name": "Exemplo", "count_text": "Membro #1", "position": 1, "level": 1, "xp": 0,
+    })
+
+@lru_cache(maxsize=16)
+def compile_template(tpl_json: str):
+    """(tamanho, cor de fundo, camadas estáticas, camadas dinâmicas) de um template"""
+    template = json.loads(tpl_json)
+    static = tuple(layer for layer in template["layers"] if not _is_dynamic(layer))
+    dynamic = tuple(layer for layer in template["layers"] if _is_dynamic(layer))
+    return tuple(template["size"]), tuple(template.get("background", (0, 0, 0, 255))), static, dynamic
+
+_MEASURE = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+
+@lru_cache(maxsize=4096)
+def text_bbox(text: str, font_name: str, size: int):
+    return _MEASURE.textbbox((0, 0), text, font=_load_font(CARD_FONTS[font_name], size))
+
+def _draw_text(img, draw, layer: dict, text: str):
+    font_name = layer.get("font", "regular")
+    size = layer.get("size", 22)
+    font = _load_font(CARD_FONTS[font_name], size)
+    bbox = text_bbox(text, font_name, size)
+    text_w = bbox[2] - bbox[0]
+    if "box" in layer:
+        bx, by, bw, bh = layer["box"]
+        x = bx + (bw - text_w) // 2
+        y = by + (bh - (bbox[3] - bbox[1])) // 2
+    else:
+        x = (img.width - text_w) // 2 if layer.get("x") == "center" else layer.get("x", 0)
+        y = layer.get("y", 0)
+    shadow = layer.get("shadow")
+    if shadow:
+        draw.text((x + shadow.get("dx", 2), y + shadow.get("dy", 2)), text, font=font, fill=tuple(shadow["color"]))
+    draw.text((x, y), text, font=font, fill=tuple(layer["color"]))
+
+@lru_cache(maxsize=16)
+def template_base(tpl_json: str, background_path: str = None, background_key: str = None):
+    """Camadas estáticas do template já rasterizadas (não alterar: use .copy())"""
+    size, background, static, _ = compile_template(tpl_json)
+    img = Image.new("RGBA", size, background)
+    draw = ImageDraw.Draw(img)
+    for layer in static:
+        kind = layer["type"]
+        if kind == "background_image":
+            if background_path:
+                try:
+                    img.paste(load_welcome_layer(background_path, background_key), (0, 0))
+                except Exception as e:
+                    print(f"Erro ao carregar imagem de fundo: {e}")
+        elif kind == "overlay":
+            img = Image.alpha_composite(img, Image.new("RGBA", size, tuple(layer["color"])))
+            draw = ImageDraw.Draw(img)
+        elif kind == "rect":
+            x, y, w, h = layer["box"]
+            draw.rectangle([x, y, x + w, y + h], fill=tuple(layer["color"]))
+        elif kind == "rounded_rect":
+            x, y, w, h = layer["box"]
+            draw.rounded_rectangle([x, y, x + w, y + h], radius=layer.get("radius", 0), fill=tuple(layer["color"]))
+        elif kind == "text":
+            _draw_text(img, draw, layer, layer["text"])
+    return img
+
+def card_values(spec: dict) -> dict:
+    values = {k: v for k, v in spec.items() if isinstance(v, (str, int, float))}
+    if "xp" in spec and "level" in spec:
+        values["cur"], values["next_xp"] = rank_progress(spec["xp"], spec["level"])
+    return values
+
+def render_card(tpl_json: str, spec: dict) -> bytes:
+    """Copia a base estática do template e desenha só as camadas dinâmicas"""
+    _, _, _, dynamic = compile_template(tpl_json)
+    img = template_base(tpl_json, spec.get("background_path"), spec.get("background_key")).copy()
+    draw = ImageDraw.Draw(img)
+    values = card_values(spec)
+
+    for layer in dynamic:
+        kind = layer["type"]
+        if kind == "avatar":
+            try:
+                tile = _tile_from_spec(spec, layer["kind"])
+            except Exception as e:
+                print(f"Erro ao carregar avatar do usuário: {e}")
+                tile = None
+            if tile is not None:
+                x = (img.width - tile.width) // 2 if layer.get("x") == "center" else layer.get("x", 0)
+                # O tile do rank mantém a transparência do avatar, recortado pela máscara
+                mask = circle_mask(tile.width) if layer["kind"] == "rank" else tile
+                img.paste(tile, (x, layer.get("y", 0)), mask)
+        elif kind == "progress_bar":
+            x0, y0, bar_w, bar_h = layer["box"]
+            fill_w = int(bar_w * min(1.0, values["cur"] / values["next_xp"]))
+            if fill_w > 0:
+                filled_bar = Image.new("RGBA", (fill_w, bar_h), (0, 0, 0, 0))
+                ImageDraw.Draw(filled_bar).rounded_rectangle(
+                    [0, 0, fill_w, bar_h], radius=layer.get("radius", 0), fill=tuple(layer["color"])
+                )
+                img.paste(filled_bar, (x0, y0), filled_bar)
+        elif kind == "text":
+            _draw_text(img, draw, layer, layer["text"].format(**values))
+
+    return encode_card(img, spec.get("encoder"))
+
+@lru_cache(maxsize=4)
+def load_welcome_layer(path: str, key: str = None):
+    """Fundo já redimensionado para o cartão, lido do disco
+
+    O arquivo tem nome fixo e é trocado com os.replace; `key` (hash do conteúdo)
+    entra só na chave do cache para um fundo novo não reaproveitar o antigo.
+    """
+    with Image.open(path) as layer:
+        return layer.convert("RGBA")
+
+def prepare_welcome_background(raw: bytes):
+    """Redimensiona o fundo para o cartão; o overlay do template entra em template_base()"""
+    bg = decode_image(raw, WELCOME_SIZE)
+    return bg.resize(WELCOME_SIZE)
+
+class WelcomeBackgroundCache:
+    """Fundo de boas-vindas baixado e preparado uma vez, em memória e em disco
+
+    O arquivo tem nome fixo e é trocado atomicamente (os.replace), então um
+    render lendo o fundo antigo nunca encontra o arquivo apagado; um JSON ao
+    lado guarda URL, hash e horário da busca, e o cache sobrevive a reinícios.
+    A URL só é buscada de novo quando muda ou passa WELCOME_BG_TTL; no
+    on_member_join `current()` só devolve caminho e hash (sem rede), e um
+    fundo vencido continua sendo usado enquanto a atualização roda em segundo
+    plano. URLs que falham esperam um backoff antes da próxima tentativa.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, ttl=WELCOME_BG_TTL):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.meta_path = os.path.join(cache_dir, "welcome-bg.json")
+        self.layer_path = os.path.join(cache_dir, "welcome-bg.png")
+        self.url = None
+        self.key = None
+        self.path = None
+        self.fetched = 0
+        self.lock = Lock()
+        self.refreshing = False
+        self.failures = {}  # url -> (falhas seguidas, próxima tentativa em epoch)
+        self._load_meta()
+
+    def _load_meta(self):
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if os.path.exists(self.layer_path):
+                self.url, self.key, self.path, self.fetched = meta["url"], meta["key"], self.layer_path, meta["fetched"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _write_meta(self):
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"url": self.url, "key": self.key, "fetched": self.fetched}, f)
+        os.replace(tmp, self.meta_path)
+
+    def refresh(self, url: str, force=False) -> bool:
+        """Baixa e prepara o fundo se a URL mudou ou venceu (bloqueante: rodar em thread)"""
+        if not url:
+            return False
+        with self.lock:
+            try:
+                if not force and url == self.url and self.path and time.time() - self.fetched < self.ttl:
+                    return True
+                response = requests.get(url, timeout=15)
+                response.raise_for_status()
+                raw = response.content
+                # Tamanho e versão do preparo entram no hash: mudar o layout invalida o arquivo
+                key = hashlib.sha256(raw + repr(("v2", WELCOME_SIZE)).encode()).hexdigest()[:16]
+                path = self.layer_path
+                if key != self.key or not os.path.exists(path):
+                    layer = prepare_welcome_background(raw)
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    tmp = path + ".tmp"
+                    layer.save(tmp, format="PNG")
+                    os.replace(tmp, path)
+                self.url, self.key, self.path, self.fetched = url, key, path, time.time()
+                self._write_meta()
+                self.failures.pop(url, None)
+                return True
+            except Exception as e:
+                print(f"Erro ao preparar imagem de fundo: {e}")
+                fails = self.failures.get(url, (0, 0))[0] + 1
+                delay = min(self.ttl, WELCOME_BG_RETRY * 2 ** (fails - 1))
+                self.failures = {url: (fails, time.time() + delay)}
+                return False
+            finally:
+                self.refreshing = False
+
+    def current(self, url: str):
+        """(caminho, hash) do fundo pronto para a URL configurada, ou (None, None) (sem I/O de rede)"""
+        if not url:
+            return None, None
+        now = time.time()
+        stale = url != self.url or now - self.fetched >= self.ttl
+        retry_at = self.failures.get(url, (0, 0))[1]
+        if stale and not self.refreshing and now >= retry_at:
+            self.refreshing = True
+            Thread(target=self.refresh, args=(url,), daemon=True).start()
+        return (self.path, self.key) if url == self.url else (None, None)
+
+welcome_bg_cache = WelcomeBackgroundCache()
+
+# Tiles de avatar: RGBA cru já redimensionado e recortado em círculo (tipo -> lado em px)
+AVATAR_TILE_SIZES = {
+    "rank": RANK_AVATAR,
+    "welcome": WELCOME_AVATAR + WELCOME_BORDER * 2,
+    "leaderboard": LEADERBOARD_AVATAR,
+}
+
+def cdn_size(px: int) -> int:
+    """Menor tamanho aceito pelo CDN do Discord (potência de 2, 16-4096) que cobre px"""
+    return min(4096, max(16, 1 << (px - 1).bit_length()))
+
+def decode_image(raw: bytes, target=None):
+    """Decodifica só o necessário: 1º quadro de GIF/WEBP animado e JPEG em modo draft
+
+    O draft faz o decodificador JPEG reduzir por 1/2, 1/4 ou 1/8 já na leitura,
+    sem ficar menor que `target`; convert() carrega apenas o quadro atual
+    (o primeiro, logo após o open), nunca a animação inteira.
+    """
+    img = Image.open(BytesIO(raw))
+    if target and img.format == "JPEG":
+        img.draft("RGB", target)
+    return img.convert("RGBA")
+
+def _avatar_tile_image(raw: bytes, kind: str):
+    if kind != "welcome":
+        # rank e leaderboard: avatar redondo do tamanho do tile. Alfa fora do
+        # círculo zerado; dentro mantém a transparência do próprio avatar
+        side = AVATAR_TILE_SIZES[kind]
+        avatar = decode_image(raw, (side, side)).resize((side, side))
+        avatar.putalpha(ImageChops.darker(avatar.getchannel("A"), circle_mask(side)))
+        return avatar
+    avatar = decode_image(raw, (WELCOME_AVATAR * WELCOME_UPSCALE,) * 2)
+    # welcome: avatar montado 4x maior dentro do disco da borda e reduzido com LANCZOS
+    size = WELCOME_AVATAR * WELCOME_UPSCALE
+    border_h = AVATAR_TILE_SIZES["welcome"]
+    avatar = avatar.resize((size, size))
+    border = border_disc(border_h * WELCOME_UPSCALE, WELCOME_BORDER_COLOR).copy()
+    offset = WELCOME_BORDER * WELCOME_UPSCALE
+    border.paste(avatar, (offset, offset), circle_mask(size))
+    return border.resize((border_h, border_h), Image.Resampling.LANCZOS)
+
+def render_avatar_tile(spec: dict) -> bytes:
+    """Avatar (bytes de PNG/WEBP/GIF) -> tile RGBA cru do tipo pedido"""
+    return _avatar_tile_image(spec["avatar"], spec["kind"]).tobytes()
+
+def _tile_from_spec(spec: dict, kind: str):
+    """Tile pronto vindo do cache (avatar_tile) ou montado aqui a partir do avatar cru"""
+    if spec.get("avatar_tile"):
+        side = AVATAR_TILE_SIZES[kind]
+        return Image.frombytes("RGBA", (side, side), spec["avatar_tile"])
+    if spec.get("avatar"):
+        return _avatar_tile_image(spec["avatar"], kind)
+    return None
+
+class ByteLRU:
+    """LRU limitado pelo total de bytes guardados (não pela quantidade de entradas)"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # chave -> (valor, tamanho)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, size: int = None):
+        size = len(value) if size is None else size
+        if size > self.max_bytes:
+            return False
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self.entries[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+        return True
+
+    def discard(self, predicate):
+        for key in [k for k in self.entries if predicate(k)]:
+            self.bytes -= self.entries.pop(key)[1]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+avatar_cache = ByteLRU(AVATAR_CACHE_BYTES)
+rank_card_cache = ByteLRU(RANK_CARD_CACHE_BYTES)
+leaderboard_cache = ByteLRU(LEADERBOARD_CACHE_BYTES)
+
+def rank_progress(xp: int, lvl: int):
+    """(XP no nível, XP do nível) exatamente como aparecem na barra do cartão"""
+    next_xp = 100 + lvl*50
+    return xp % next_xp, next_xp
+
+def rank_card_key(spec: dict, avatar_key):
+    """Tudo que aparece no cartão: mudar qualquer campo gera outra chave
+
+    O progresso entra como (XP no nível, XP do nível) e não em faixas porque o
+    texto da barra mostra o número exato; a largura da barra deriva dele.
+    """
+    return (spec["name"], avatar_key, spec["level"], spec["position"],
+            rank_progress(spec["xp"], spec["level"]), spec.get("theme"),
+            tuple(sorted((spec.get("encoder") or {}).items())))
+
+def warm_render_assets():
+    """Pré-carrega fontes, máscaras e camadas (initializer dos workers e startup)"""
+    circle_mask(WELCOME_AVATAR * WELCOME_UPSCALE)
+    circle_mask(RANK_AVATAR)
+    border_disc((WELCOME_AVATAR + WELCOME_BORDER * 2) * WELCOME_UPSCALE, WELCOME_BORDER_COLOR)
+    for tpl_json in DEFAULT_TEMPLATE_JSON.values():
+        for layer in compile_template(tpl_json)[3]:
+            if layer["type"] == "text":
+                _load_font(CARD_FONTS[layer.get("font", "regular")], layer.get("size", 22))
+        template_base(tpl_json)
+
+def _encode_profile(img, profile: str, encoder: dict) -> bytes:
+    buf = BytesIO()
+    if profile == "png_optimized":
+        img.save(buf, format="PNG", compress_level=encoder["compress_level"], optimize=encoder["compress_level"] >= 9)
+    elif profile == "palette":
+        # FASTOCTREE aceita RGBA; bom para cartões de cor chapada, gera faixas em fotos
+        img.quantize(encoder["colors"], method=Image.Quantize.FASTOCTREE).save(
+            buf, format="PNG", compress_level=encoder["compress_level"]
+        )
+    elif profile == "webp":
+        img.save(buf, format="WEBP", quality=encoder["quality"], method=4)
+    elif profile == "jpeg":
+        # JPEG não tem transparência: áreas transparentes do template saem pretas
+        img.convert("RGB").save(buf, format="JPEG", quality=encoder["quality"], optimize=True)
+    else:
+        img.save(buf, format="PNG")
+    return buf.getvalue()
+
+# Média móvel do tempo de cada perfil neste processo; o modo auto pula os perfis
+# que estourariam o orçamento em vez de descobrir isso codificando
+_encode_ms = {}
+
+def encode_card(img, encoder: dict = None) -> bytes:
+    """Codifica o cartão conforme o perfil do servidor (padrão: PNG como sempre foi)"""
+    encoder = encoder or DEFAULT_ENCODER_CONFIG
+    if encoder["profile"] != "auto":
+        return _encode_profile(img, encoder["profile"], encoder)
+
+    best = None
+    spent = 0.0
+    for profile in AUTO_ENCODER_ORDER:
+        # Perfil sem medição ainda é testado uma vez; os já medidos só se couberem no orçamento
+        if spent + _encode_ms.get(profile, 0.0) > encoder["budget_ms"]:
+            continue
+        t0 = time.perf_counter()
+        out = _encode_profile(img, profile, encoder)
+        elapsed = (time.perf_counter() - t0) * 1000
+        _encode_ms[profile] = elapsed if profile not in _encode_ms else 0.8 * _encode_ms[profile] + 0.2 * elapsed
+        spent += elapsed
+        if best is None or len(out) < len(best):
+            best = out
+    # Nada coube no orçamento: PNG padrão, como sem perfil
+    return best if best is not None else _encode_profile(img, "png", encoder)
+
+def card_filename(stem: str, raw: bytes) -> str:
+    """Nome do anexo com a extensão do formato que o encoder escolheu"""
+    if raw[:4] == b"RIFF":
+        return f"{stem}.webp"
+    if raw[:2] == b"\xff\xd8":
+        return f"{stem}.jpg"
+    return f"{stem}.png"
+
+# As funções render_* são puras (spec -> bytes da imagem) para rodar num processo
+# separado: a spec só tem bytes, textos, números, o template em JSON e o encoder.
+def render_welcome_card(spec: dict) -> bytes:
+    """Cartão de boas-vindas (padrão 900x300: fundo, avatar com borda, nome e contagem)"""
+    return render_card(spec.get("template") or DEFAULT_TEMPLATE_JSON["welcome"], spec)
+
+def render_rank_card(spec: dict) -> bytes:
+    """Cartão de perfil (padrão 900x200: avatar, nome, posição, nível e barra de XP)"""
+    return render_card(spec.get("template") or DEFAULT_TEMPLATE_JSON["rank"], spec)
+
+@lru_cache(maxsize=LEADERBOARD_PAGE)
+def leaderboard_base(rows: int):
+    """Fundo do placar com as faixas das linhas (não alterar: use .copy())"""
+    height = LEADERBOARD_HEADER + rows * LEADERBOARD_ROW + 16
+    img = Image.new("RGBA", (LEADERBOARD_WIDTH, height), (0, 0, 0, 255))
+    draw = ImageDraw.Draw(img)
+    for i in range(rows):
+        y = LEADERBOARD_HEADER + i * LEADERBOARD_ROW
+        draw.rounded_rectangle([20, y + 4, LEADERBOARD_WIDTH - 20, y + LEADERBOARD_ROW - 4], radius=12,
+                               fill=(45, 45, 45) if i % 2 == 0 else (30, 30, 30))
+    return img
+
+def _row_text(draw, text: str, font_name: str, size: int, x, row_y: int, fill, right=False):
+    """Texto centrado na vertical da linha; com right=True, x é a borda direita"""
+    bbox = text_bbox(text, font_name, size)
+    if right:
+        x -= bbox[2] - bbox[0]
+    y = row_y + (LEADERBOARD_ROW - (bbox[3] - bbox[1])) // 2 - bbox[1]
+    draw.text((x, y), text, font=_load_font(CARD_FONTS[font_name], size), fill=fill)
+
+def render_leaderboard_card(spec: dict) -> bytes:
+    """Placar de uma página: título e uma linha por membro (posição, avatar, nome, nível e XP)"""
+    rows = spec["rows"]
+    img = leaderboard_base(max(1, len(rows))).copy()
+    draw = ImageDraw.Draw(img)
+
+    bbox = text_bbox(spec["title"], "bold", 32)
+    draw.text(((LEADERBOARD_WIDTH - (bbox[2] - bbox[0])) // 2, 22), spec["title"],
+              font=_load_font(FONT_BOLD, 32), fill=(0, 255, 255))
+
+    podium = {1: (255, 215, 0), 2: (192, 192, 192), 3: (205, 127, 50)}
+    for i, row in enumerate(rows):
+        y = LEADERBOARD_HEADER + i * LEADERBOARD_ROW
+        _row_text(draw, f"#{row['position']}", "bold", 26, 40, y, podium.get(row["position"], (255, 255, 255)))
+        tile = _tile_from_spec(row, "leaderboard")
+        if tile is not None:
+            img.paste(tile, (130, y + (LEADERBOARD_ROW - LEADERBOARD_AVATAR) // 2), circle_mask(LEADERBOARD_AVATAR))
+        name = row["name"] if len(row["name"]) <= 24 else row["name"][:23] + "…"
+        _row_text(draw, name, "regular", 24, 200, y, (255, 255, 255))
+        _row_text(draw, f"Nível {row['level']} · {row['xp']} XP", "regular", 22, LEADERBOARD_WIDTH - 40, y,
+                  (0, 200, 255), right=True)
+
+    return encode_card(img, spec.get("encoder"))
+
+def _render_ping(_spec=None) -> bool:
+    return True
+
+class RenderBusyError(Exception):
+    """A fila de renderização está cheia e não abriu vaga a tempo"""
+
+class RenderService:
+    """Executa as funções render_* fora do event loop
+
+    Usa um ProcessPoolExecutor (PIL não solta o GIL em boa parte do trabalho)
+    e cai para um ThreadPoolExecutor se os processos não sobem ou morrem. Um
+    semáforo limita renders em andamento + na fila: quem passa do limite
+    espera (backpressure) e, depois de RENDER_QUEUE_TIMEOUT, recebe
+    RenderBusyError para responder sem imagem.
+    """
+
+    def __init__(self, workers=RENDER_WORKERS, max_pending=RENDER_MAX_PENDING):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.executor = None
+        self.mode = None
+        self.semaphore = None
+        self.pending = 0
+        self.rendered = 0
+        self.rejected = 0
+
+    def _use_threads(self, reason):
+        print(f"[RENDER] Usando threads: {reason}")
+        warm_render_assets()
+        old = self.executor
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+        self.mode = "thread"
+        if old is not None:
+            old.shutdown(wait=False, cancel_futures=True)
+
+    async def start(self, processes=True):
+        """Sobe o pool de processos e confirma que ele responde; senão usa threads
+
+        processes=False vai direto para threads (benchmarks medem tudo no mesmo processo).
+        """
+        if self.executor is not None:
+            return self.mode
+        self.semaphore = asyncio.Semaphore(self.max_pending)
+        if not processes:
+            self._use_threads("pedido explícito")
+            return self.mode
+        try:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=warm_render_assets
+            )
+            self.mode = "process"
+            loop = asyncio.get_running_loop()
+            await asyncio.wait_for(loop.run_in_executor(self.executor, _render_ping), timeout=60)
+        except Exception as e:
+            self._use_threads(f"pool de processos indisponível ({e!r})")
+        print(f"[RENDER] Serviço de renderização pronto ({self.mode}, {self.workers} workers)")
+        return self.mode
+
+    async def render(self, fn, spec: dict) -> bytes:
+        if self.executor is None:
+            await self.start()
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=RENDER_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise RenderBusyError(f"{self.pending} renders pendentes")
+
+        self.pending += 1
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                result = await loop.run_in_executor(self.executor, fn, spec)
+            except BrokenProcessPool as e:
+                self._use_threads(f"pool de processos quebrou ({e!r})")
+                result = await loop.run_in_executor(self.executor, fn, spec)
+            self.rendered += 1
+            return result
+        finally:
+            self.pending -= 1
+            self.semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rendered": self.rendered,
+            "rejected": self.rejected,
+        }
+
+render_service = RenderService()
+
+async def fetch_avatar_tile(member, kind: str):
+    """Tile do avatar do membro pelo cache; no miss baixa uma vez e monta no pool de render
+
+    A chave usa display_avatar.key, que muda quando o membro troca de avatar
+    (e cobre quem não tem avatar próprio, com o avatar padrão do Discord).
+    O download pede ao CDN o tamanho mais próximo do tile e formato estático
+    (avatares animados continuam GIF, mas só o 1º quadro é decodificado).
+    Retorna None se o download ou a montagem falhar (rede, avatar corrompido);
+    só RenderBusyError sobe para o handler.
+    """
+    asset = member.display_avatar
+    key = (member.id, asset.key, kind)
+    tile = avatar_cache.get(key)
+    if tile is not None:
+        return tile
+    try:
+        raw = await asset.with_size(cdn_size(AVATAR_TILE_SIZES[kind])).with_static_format("png").read()
+        tile = await render_service.render(render_avatar_tile, {"avatar": raw, "kind": kind})
+    except RenderBusyError:
+        raise
+    except Exception as e:
+        print(f"Erro ao carregar avatar de {member.id}: {e}")
+        return None
+    avatar_cache.put(key, tile)
+    return tile
+
+# Downloads de avatar que passaram do timeout do placar: a referência aqui impede
+# que o loop os colete antes de terminarem de aquecer o cache
+_warming_tiles = set()
+
+async def fetch_leaderboard_tiles(members, timeout: float = LEADERBOARD_AVATAR_TIMEOUT):
+    """Tiles de uma página do placar em paralelo (até LEADERBOARD_FETCH_CONCURRENCY por vez)
+
+    Quem não ficar pronto em `timeout` segundos vem como None e o placar sai sem
+    aquele avatar; os downloads pendentes seguem e aquecem o cache para o próximo pedido.
+    """
+    semaphore = asyncio.Semaphore(LEADERBOARD_FETCH_CONCURRENCY)
+
+    async def fetch(member):
+        async with semaphore:
+            return await fetch_avatar_tile(member, "leaderboard")
+
+    tasks = [asyncio.create_task(fetch(m)) if m is not None else None for m in members]
+    pending = [t for t in tasks if t is not None]
+    for task in pending:
+        _warming_tiles.add(task)
+        # Falhas de quem terminar depois do timeout não viram "exception never retrieved"
+        task.add_done_callback(lambda t: _warming_tiles.discard(t) or t.cancelled() or t.exception())
+    if pending:
+        await asyncio.wait(pending, timeout=timeout)
+    return [
+        t.result() if t is not None and t.done() and not t.cancelled() and t.exception() is None else None
+        for t in tasks
+    ]
+
+# ========================
+# EVENTOS DO BOT
+# ========================
+@bot.event
+async def on_ready():
+    bot.start_time = datetime.now()
+    
+    print(f"\n{'='*50}")
+    print(f"🤖 BOT INICIADO COM SUCESSO!")
+    print(f"{'='*50}")
+    print(f"📛 Nome: {bot.user}")
+    print(f"🆔 ID: {bot.user.id}")
+    print(f"✅ Status: {'PRONTO' if bot.is_ready() else 'NÃO PRONTO'}")
+    print(f"{'='*50}")
+    
+    print(f"🏠 GUILDS CONECTADAS ({len(bot.guilds)}):")
+    for i, guild in enumerate(bot.guilds, 1):
+        print(f"  {i}. {guild.name} (ID: {guild.id}) - Membros: {len(guild.members)}")
+    print(f"{'='*50}")
+    
+    target_guild = None
+    if GUILD_ID:
+        target_guild = bot.get_guild(int(GUILD_ID))
+        if target_guild:
+            print(f"🎯 GUILD ALVO ENCONTRADA:")
+            print(f"   Nome: {target_guild.name}")
+            print(f"   ID: {target_guild.id}")
+            print(f"   👥 Membros: {len(target_guild.members)}")
             print(f"   📝 Canais de texto: {len(target_guild.text_channels)}")
             print(f"   🎭 Cargos: {len(target_guild.roles)}")
         else:
@@ -3100,6 +4981,7 @@ async def on_ready():
     print("📂 Carregando dados do GitHub...")
     load_success = load_data_from_github()
     print(f"   {'✅ Dados carregados' if load_success else '⚠️ Usando dados locais'}")
+    rebuild_config()
 
     print("⚙️ Sincronizando comandos slash...")
     try:
@@ -3171,6 +5053,16 @@ async def on_ready():
     
     print("="*50)
     
+    print("🎙️ Iniciando XP por voz...")
+    seed_voice_index()
+    start_voice_xp_loop()
+    print(f"   ✅ {len(voice_sessions)} membros em canais de voz")
+    modlog.start()
+    start_warn_sweeper()
+    await render_service.start()
+    if cfg.welcome_background:
+        await asyncio.to_thread(welcome_bg_cache.refresh, cfg.welcome_background)
+    
     print("🔍 Executando diagnóstico de conexão...")
     await check_bot_connection()
     
@@ -3187,102 +5079,176 @@ async def on_ready():
     
     add_log(f"Bot iniciado: {bot.user.name} ({bot.user.id}) em {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
 
-@bot.event
-async def on_member_join(member: discord.Member):
-    ch_id = data.get("config", {}).get("welcome_channel")
-    channel = None
-    if ch_id:
-        channel = member.guild.get_channel(int(ch_id))
-    if not channel:
-        channel = discord.utils.get(member.guild.text_channels, name="boas-vindas")
+def resolve_welcome_channel(guild, config):
+    channel = config.welcome_channel
+    if channel is None and config.welcome_channel_id:
+        channel = guild.get_channel(config.welcome_channel_id)
     if not channel:
-        return
+        channel = discord.utils.get(guild.text_channels, name="boas-vindas")
+    return channel
 
-    welcome_msg = data.get("config", {}).get("welcome_message", "Olá {member}, seja bem-vindo(a)!")
-    welcome_msg = welcome_msg.replace("{member}", member.mention)
+async def quarantine_worker(guild: discord.Guild, queue: asyncio.Queue, role: discord.Role, incident: dict):
+    """Aplica o cargo de quarentena em lote, espaçando as chamadas para não estourar o rate limit"""
+    while True:
+        member_id = await queue.get()
+        if member_id is None:
+            return
+        member = guild.get_member(member_id)
+        if member is None or role in member.roles:
+            continue
+        try:
+            await member.add_roles(role, reason="Modo raid: quarentena automática")
+            incident["quarantined"] += 1
+        except discord.HTTPException as e:
+            incident["quarantine_errors"] += 1
+            print(f"Erro ao aplicar quarentena em {member_id}: {e}")
+        await asyncio.sleep(RAID_QUARANTINE_INTERVAL)
+
+async def watch_raid(guild: discord.Guild, guard: RaidGuard):
+    """Acompanha o incidente aberto e, quando as entradas param, fecha com uma boas-vindas e um log únicos"""
+    config = cfg
+    incident = guard.incident
+    incident["quarantined"] = 0
+    incident["quarantine_errors"] = 0
+
+    role = config.quarantine_role
+    worker = None
+    if role is not None:
+        queue = incident["queue"] = asyncio.Queue()
+        for member_id in incident["members"]:
+            queue.put_nowait(member_id)
+        worker = asyncio.create_task(quarantine_worker(guild, queue, role, incident))
 
-    background_path = data.get("config", {}).get("welcome_background", "")
+    try:
+        logs_channel = config.logs_channel
+        if logs_channel:
+            try:
+                await logs_channel.send(
+                    f"🚨 **Modo raid ativado**: {len(incident['members'])} entradas em {config.raid['window']}s. "
+                    "Cartões de boas-vindas suspensos" + (f", aplicando {role.mention}." if role else ".")
+                )
+            except discord.HTTPException:
+                pass
 
-    width, height = 900, 300
-    img = Image.new("RGBA", (width, height), (0, 0, 0, 255))
+        while not guard.expired(time.monotonic(), cfg.raid):
+            await asyncio.sleep(5)
+    finally:
+        # Mesmo com erro o servidor sai do modo raid; senão toda entrada seguinte seria engolida
+        guard.close()
+        guard.task = None
+        if worker is not None:
+            incident["queue"].put_nowait(None)
+            await asyncio.gather(worker, return_exceptions=True)
+
+    config = cfg
+    members = incident["members"]
+    duration = int(incident["last_join"] - incident["started"])
+
+    channel = resolve_welcome_channel(guild, config)
+    if channel:
+        names = [m.display_name for m in map(guild.get_member, members[:20]) if m]
+        extra = f" e mais {len(members) - len(names)}" if len(members) > len(names) else ""
+        try:
+            await channel.send(
+                f"👋 Boas-vindas aos **{len(members)}** novos membros: {', '.join(names)}{extra}!",
+                allowed_mentions=discord.AllowedMentions.none(),
+            )
+        except discord.HTTPException:
+            pass
 
-    if background_path:
+    summary = {
+        "started_at": incident["started_at"],
+        "duration": duration,
+        "joins": len(members),
+        "quarantined": incident["quarantined"],
+        "quarantine_errors": incident["quarantine_errors"],
+    }
+    incidents = data.setdefault("raid_incidents", [])
+    incidents.append(summary)
+    del incidents[:-20]
+
+    if config.logs_channel:
+        embed = discord.Embed(title="🚨 Incidente de raid encerrado", color=discord.Color.red())
+        embed.add_field(name="Entradas", value=str(len(members)))
+        embed.add_field(name="Duração", value=f"{duration}s")
+        embed.add_field(name="Em quarentena", value=str(incident["quarantined"]) if role else "desativado")
         try:
-            response = requests.get(background_path)
-            bg = Image.open(BytesIO(response.content)).convert("RGBA")
-            bg = bg.resize((width, height))
-            img.paste(bg, (0, 0))
-        except Exception as e:
-            print(f"Erro ao carregar imagem de fundo: {e}")
+            await config.logs_channel.send(embed=embed)
+        except discord.HTTPException:
+            pass
 
-    overlay = Image.new("RGBA", (width, height), (50, 50, 50, 150))
-    img = Image.alpha_composite(img, overlay)
+    add_log(f"raid: {len(members)} entradas em {duration}s, {incident['quarantined']} em quarentena")
 
-    draw = ImageDraw.Draw(img)
+@bot.event
+async def on_member_join(member: discord.Member):
+    config = cfg
+    guard = get_raid_guard(member.guild.id)
+    state = guard.record_join(member.id, time.monotonic(), config.raid)
+    if state != "normal":
+        # Em modo raid nada de cartão nem log por membro: tudo vai para o resumo do incidente
+        if state == "started":
+            guard.task = asyncio.create_task(watch_raid(member.guild, guard))
+        elif "queue" in guard.incident:
+            guard.incident["queue"].put_nowait(member.id)
+        return
 
-    try:
-        user_bytes = await member.avatar.read()
-        user_avatar = Image.open(BytesIO(user_bytes)).convert("RGBA")
-
-        avatar_size = 150
-        border_size = 5
-        upscale = 4
-        big_size = (avatar_size + border_size * 2) * upscale
-
-        user_avatar = user_avatar.resize((avatar_size * upscale, avatar_size * upscale))
-        mask = Image.new("L", (avatar_size * upscale, avatar_size * upscale), 0)
-        mask_draw = ImageDraw.Draw(mask)
-        mask_draw.ellipse((0, 0, avatar_size * upscale, avatar_size * upscale), fill=255)
-
-        border_color = (200, 150, 255, 255)
-        border = Image.new("RGBA", (big_size, big_size), (0, 0, 0, 0))
-        draw_border = ImageDraw.Draw(border)
-        draw_border.ellipse((0, 0, big_size, big_size), fill=border_color)
-
-        border.paste(user_avatar, (border_size * upscale, border_size * upscale), mask)
-        border = border.resize((avatar_size + border_size * 2, avatar_size + border_size * 2), Image.Resampling.LANCZOS)
-
-        x = (width - border.width) // 2
-        y = 30
-        img.paste(border, (x, y), border)
-    except Exception as e:
-        print(f"Erro ao carregar avatar do usuário: {e}")
+    channel = resolve_welcome_channel(member.guild, config)
+    if not channel:
+        return
 
+    welcome_msg = config.format_welcome(member.mention)
+
+    background_path, background_key = welcome_bg_cache.current(config.welcome_background)
+    spec = {
+        "background_path": background_path,
+        "background_key": background_key,
+        "name": member.display_name,
+        "count_text": f"Membro #{len(member.guild.members)}",
+        "template": config.card_templates.get("welcome"),
+        "encoder": config.encoder,
+    }
     try:
-        font_b = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 36)
-        font_s = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 24)
-    except:
-        font_b = ImageFont.load_default()
-        font_s = ImageFont.load_default()
+        spec["avatar_tile"] = await fetch_avatar_tile(member, "welcome")
+        png = await render_service.render(render_welcome_card, spec)
+    except RenderBusyError:
+        await channel.send(content=welcome_msg)
+        add_log(f"member_join: {member.id} - {member} (sem cartão, renderização ocupada)")
+        return
+    except Exception as e:
+        print(f"Erro ao gerar cartão de boas-vindas: {e}")
+        await channel.send(content=welcome_msg)
+        add_log(f"member_join: {member.id} - {member} (sem cartão, erro na renderização)")
+        return
 
-    text_color = (200, 150, 255)
-    shadow_color = (0, 0, 0, 180)
+    file = discord.File(BytesIO(png), filename=card_filename("welcome", png))
 
-    text_name = member.display_name
-    bbox_name = draw.textbbox((0, 0), text_name, font=font_b)
-    text_w = bbox_name[2] - bbox_name[0]
-    text_x = (width - text_w) // 2
-    text_y = y + border.height + 10
+    await channel.send(content=welcome_msg, file=file)
+    add_log(f"member_join: {member.id} - {member}")
 
-    draw.text((text_x + 2, text_y + 2), text_name, font=font_b, fill=shadow_color)
-    draw.text((text_x, text_y), text_name, font=font_b, fill=text_color)
+@bot.event
+async def on_guild_channel_delete(channel):
+    # Canais resolvidos no snapshot podem ter deixado de existir
+    rebuild_config()
 
-    text_count = f"Membro #{len(member.guild.members)}"
-    bbox_count = draw.textbbox((0, 0), text_count, font=font_s)
-    text_w2 = bbox_count[2] - bbox_count[0]
-    text_x2 = (width - text_w2) // 2
-    text_y2 = text_y + 50
+@bot.event
+async def on_guild_role_delete(role):
+    rebuild_config()
 
-    draw.text((text_x2 + 1, text_y2 + 1), text_count, font=font_s, fill=shadow_color)
-    draw.text((text_x2, text_y2), text_count, font=font_s, fill=text_color)
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    # Permissões ou nome (fallback de staff por nome) podem ter mudado
+    if before.permissions != after.permissions or (cfg.staff_by_name and before.name != after.name):
+        rebuild_config()
 
-    buf = BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
-    file = discord.File(buf, filename="welcome.png")
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    if before.roles != after.roles:
+        member_flags.invalidate(after.guild.id, after.id)
 
-    await channel.send(content=welcome_msg, file=file)
-    add_log(f"member_join: {member.id} - {member}")
+@bot.event
+async def on_member_remove(member: discord.Member):
+    member_flags.invalidate(member.guild.id, member.id)
+    spam_detector.forget(str(member.id))
 
 # ========================
 # REACTION ROLES
@@ -3351,165 +5317,847 @@ async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
     except Exception as e:
         print("on_raw_reaction_remove error:", e)
 
+# ========================
+# LOG DE MODERAÇÃO
+# ========================
+MODLOG_FLUSH_SECONDS = 30   # intervalo máximo entre resumos
+MODLOG_FLUSH_EVENTS = 20    # resumo antecipado ao acumular esse tanto de eventos
+MODLOG_DIGEST_LINES = 25
+
+MODLOG_ICONS = {"warn": "⚠️", "embed": "📝", "timeout": "🔇", "kick": "👢", "raid": "🚨"}
+
+class ModerationEventBus:
+    """Acumula eventos de moderação e publica um resumo (embed) no canal de logs
+
+    Cada evento vai com todos os detalhes para `data["logs"]` na hora, mas o
+    envio ao Discord e o save no GitHub acontecem uma vez por resumo: a cada
+    MODLOG_FLUSH_SECONDS ou MODLOG_FLUSH_EVENTS eventos. Eventos críticos
+    antecipam o resumo.
+    """
+
+    def __init__(self, flush_seconds=MODLOG_FLUSH_SECONDS, flush_events=MODLOG_FLUSH_EVENTS):
+        self.flush_seconds = flush_seconds
+        self.flush_events = flush_events
+        self.pending = []
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def emit(self, kind: str, user_id, reason: str = "", actor="bot", critical=False, **details):
+        event = {"ts": now_br().isoformat(), "kind": kind, "user": str(user_id), "actor": str(actor), "reason": reason}
+        event.update(details)
+        data.setdefault("logs", []).append({
+            "ts": event["ts"],
+            "entry": f"{kind}: user={event['user']} by={event['actor']} reason={reason}",
+            "event": event,
+        })
+        self.pending.append(event)
+        if critical or len(self.pending) >= self.flush_events:
+            self.wakeup.set()
+        return event
+
+    def digest_embed(self, events) -> discord.Embed:
+        counts = {}
+        lines = []
+        for event in events:
+            counts[event["kind"]] = counts.get(event["kind"], 0) + 1
+            if len(lines) < MODLOG_DIGEST_LINES:
+                icon = MODLOG_ICONS.get(event["kind"], "•")
+                who = f"<@{event['user']}>" if event["user"].isdigit() else event["user"]
+                by = "" if event["actor"] == "bot" else f" (por {event['actor']})"
+                lines.append(f"{icon} {who} — {event['reason'][:120]}{by}")
+        if len(events) > len(lines):
+            lines.append(f"… e mais {len(events) - len(lines)} eventos")
+
+        embed = discord.Embed(
+            title=f"🛡️ Moderação: {len(events)} evento(s)",
+            description="\n".join(lines)[:4000],
+            color=discord.Color.orange(),
+        )
+        embed.set_footer(text=" | ".join(f"{kind}: {n}" for kind, n in sorted(counts.items())))
+        return embed
+
+    async def flush(self):
+        if not self.pending:
+            return
+        events, self.pending = self.pending, []
+        logs_channel = cfg.logs_channel
+        if logs_channel:
+            try:
+                await logs_channel.send(embed=self.digest_embed(events))
+            except discord.HTTPException as e:
+                print(f"[MODLOG] Erro ao enviar resumo: {e}")
+        save_data_to_github(f"Moderação: {len(events)} evento(s)")
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[MODLOG] Erro no resumo: {e}")
+
+    def start(self):
+        if self.task is not None and not self.task.done():
+            return False
+        self.task = bot.loop.create_task(self.run())
+        return True
+
+modlog = ModerationEventBus()
+
 # ========================
 # WARN HELPER
 # ========================
-async def add_warn(member: discord.Member, reason=""):
+WARN_SWEEP_INTERVAL = 3600
+
+warn_sweep_task = None
+
+class WarnIndex:
+    """Índice das advertências ativas ordenado por vencimento (heap)
+
+    Guarda só (vencimento, usuário, geração) e a contagem ativa por usuário:
+    incluir e vencer custam O(log n) e a checagem de escalonamento é um
+    lookup, sem reler o histórico de ninguém. Limpar as advertências de um
+    usuário só troca a geração; entradas antigas no heap são descartadas
+    quando chegam ao topo.
+    """
+
+    def __init__(self, window: int = DEFAULT_WARN_CONFIG["expire_days"] * 86400):
+        self.window = window
+        self.heap = []
+        self.active = {}
+        self.generation = {}
+        self.expired_uids = set()  # usuários com advertências vencidas ainda não compactadas
+
+    def rebuild(self, warns: dict, window: int = None):
+        if window is not None:
+            self.window = window
+        self.heap = []
+        self.active = {}
+        self.expired_uids = set()
+        for uid, entries in warns.items():
+            for entry in entries:
+                self.push(uid, entry.get("t", 0))
+        heapq.heapify(self.heap)
+        self.expire(time.time())
+
+    def push(self, uid: str, t: float):
+        heapq.heappush(self.heap, (t + self.window, uid, self.generation.get(uid, 0)))
+        self.active[uid] = self.active.get(uid, 0) + 1
+
+    def add(self, uid: str, t: float) -> int:
+        """Registra uma advertência e retorna quantas o usuário tem ativas"""
+        self.expire(t)
+        self.push(uid, t)
+        return self.active[uid]
+
+    def count(self, uid: str) -> int:
+        return self.active.get(uid, 0)
+
+    def expire(self, now: float):
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            _, uid, gen = heapq.heappop(heap)
+            if gen != self.generation.get(uid, 0):
+                continue
+            left = self.active.get(uid, 0) - 1
+            if left > 0:
+                self.active[uid] = left
+            else:
+                self.active.pop(uid, None)
+            self.expired_uids.add(uid)
+
+    def forget(self, uid: str):
+        self.generation[uid] = self.generation.get(uid, 0) + 1
+        self.active.pop(uid, None)
+        self.expired_uids.discard(uid)
+
+warn_index = WarnIndex()
+
+def migrate_warn_timestamps():
+    """Preenche o campo epoch `t` das advertências antigas, que só tinham `ts` em texto"""
+    now = time.time()
+    for entries in data.get("warns", {}).values():
+        for entry in entries:
+            if "t" in entry:
+                continue
+            try:
+                entry["t"] = datetime.strptime(entry.get("ts", ""), "%d/%m/%Y %H:%M").replace(tzinfo=ZoneInfo("America/Sao_Paulo")).timestamp()
+            except (TypeError, ValueError):
+                entry["t"] = now
+
+async def escalate_warns(member: discord.Member, active: int):
+    """Aplica castigo/expulsão conforme as advertências ativas do membro"""
+    rules = cfg.warns
+    uid = str(member.id)
+    try:
+        if rules["kick_at"] and active >= rules["kick_at"]:
+            await member.kick(reason=f"{active} advertências ativas")
+            modlog.emit("kick", uid, f"{active} advertências ativas", critical=True)
+        elif rules["timeout_at"] and active >= rules["timeout_at"]:
+            minutes = rules["timeout_minutes"] or DEFAULT_WARN_CONFIG["timeout_minutes"]
+            await member.timeout(timedelta(minutes=minutes), reason=f"{active} advertências ativas")
+            modlog.emit("timeout", uid, f"{active} advertências ativas ({minutes} min)", critical=True)
+    except (discord.Forbidden, discord.HTTPException, AttributeError) as e:
+        print(f"[WARNS] Não foi possível escalonar {uid}: {e}")
+
+async def add_warn(member: discord.Member, reason="", actor="bot", critical=False, admin=None, **details):
+    """Único ponto de entrada de advertências (automáticas, /advertir e site)
+
+    Grava a advertência, manda o evento para o modlog (sem save aqui: o
+    resumo salva uma vez por lote) e escalona pelas advertências ativas.
+    """
     uid = str(member.id)
+    now = time.time()
     entry = {
-        "by": bot.user.id,
+        "by": bot.user.id if actor == "bot" else actor,
         "reason": reason,
-        "ts": now_br().strftime("%d/%m/%Y %H:%M")
+        "ts": now_br().strftime("%d/%m/%Y %H:%M"),
+        "t": now,
     }
+    if admin:
+        entry["admin"] = admin
     data.setdefault("warns", {}).setdefault(uid, []).append(entry)
-    save_data_to_github("Auto-warn")
-    add_log(f"warn: user={uid} by=bot reason={reason}")
+    active = warn_index.add(uid, now)
+    modlog.emit("warn", uid, reason, actor=admin or actor, critical=critical, active=active, **details)
+    await escalate_warns(member, active)
+    return active
+
+def clear_warns(uid: str) -> bool:
+    if uid not in data.get("warns", {}):
+        return False
+    data["warns"].pop(uid)
+    warn_index.forget(uid)
+    return True
+
+async def sweep_expired_warns():
+    """Move as advertências vencidas para o arquivo do mês e tira do estado quente"""
+    warn_index.expire(time.time())
+    if not warn_index.expired_uids:
+        return 0
+
+    cutoff = time.time() - warn_index.window
+    warns = data.get("warns", {})
+    expired = {}
+    for uid in warn_index.expired_uids:
+        old = [w for w in warns.get(uid, []) if w.get("t", 0) <= cutoff]
+        if old:
+            expired[uid] = old
+    if not expired:
+        warn_index.expired_uids = set()
+        return 0
+
+    name = f"warns-{now_br().strftime('%Y-%m')}.json.gz"
+    try:
+        raw = await asyncio.to_thread(load_archive_from_github, name, True)
+    except RuntimeError as e:
+        # Só 404 é arquivo novo: com qualquer outra falha regravar apagaria o mês já arquivado
+        print(f"[WARNS] Varredura adiada: {e}")
+        return 0
+    archive = json.loads(gzip.decompress(raw)) if raw else {}
+
+    for uid in expired:
+        keep = [w for w in warns[uid] if w.get("t", 0) > cutoff]
+        if keep:
+            warns[uid] = keep
+        else:
+            warns.pop(uid)
+    warn_index.expired_uids = set()
+    for uid, entries in expired.items():
+        archive.setdefault(uid, []).extend(entries)
+    payload = gzip.compress(json.dumps(archive, ensure_ascii=False).encode("utf-8"))
+    total = sum(len(e) for e in expired.values())
+    if not await asyncio.to_thread(save_archive_to_github, name, payload, f"Archive {total} expired warns"):
+        # Volta para o estado quente e tenta de novo na próxima varredura
+        for uid, entries in expired.items():
+            warns.setdefault(uid, [])[:0] = entries
+            warn_index.expired_uids.add(uid)
+        return 0
+
+    save_data_to_github(f"Compact {total} expired warns")
+    return total
+
+async def warn_sweep_loop():
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        try:
+            total = await sweep_expired_warns()
+            if total:
+                print(f"[WARNS] {total} advertências vencidas arquivadas")
+        except Exception as e:
+            print(f"[WARNS] Erro na varredura: {e}")
+        await asyncio.sleep(WARN_SWEEP_INTERVAL)
+
+def start_warn_sweeper():
+    global warn_sweep_task
+    if warn_sweep_task is not None and not warn_sweep_task.done():
+        return False
+    warn_sweep_task = bot.loop.create_task(warn_sweep_loop())
+    return True
 
 # ========================
-# ON MESSAGE
+# XP HELPERS
 # ========================
+def grant_xp(uid: str, amount: int, count_season: bool = True):
+    """Soma XP ao usuário e retorna (nível anterior, nível atual)
+
+    count_season=False credita só o total geral (XP histórico não é da temporada atual).
+    """
+    data.setdefault("xp", {})
+    data.setdefault("level", {})
+
+    data["xp"][uid] = data["xp"].get(uid, 0) + amount
+    season = data.get("season")
+    if season and count_season:
+        season["xp"][uid] = season["xp"].get(uid, 0) + amount
+    lvl_now = xp_to_level(data["xp"][uid])
+    prev_lvl = data["level"].get(uid, 1)
+
+    if lvl_now > prev_lvl:
+        data["level"][uid] = lvl_now
+    return prev_lvl, lvl_now
+
+LEVELUP_FLUSH_SECONDS = 3  # janela para juntar anúncios de um mesmo canal
+
+class LevelUpAnnouncer:
+    """Junta os anúncios de level up por canal e os cargos de nível por membro
+
+    Cada canal recebe uma única mensagem combinada a cada LEVELUP_FLUSH_SECONDS
+    (só o nível mais alto de cada membro) e cada membro uma única chamada de
+    add_roles com todos os cargos dos níveis que cruzou no período.
+    """
+
+    def __init__(self, delay=LEVELUP_FLUSH_SECONDS):
+        self.delay = delay
+        self.channels = {}   # channel_id -> (canal, {member_id: (membro, nível)})
+        self.roles = {}      # member_id -> [membro, nível anterior, nível atual, canal]
+        self.tasks = {}      # channel_id -> task do flush agendado
+
+    def queue(self, member: discord.Member, prev_lvl: int, lvl_now: int, fallback_channel=None):
+        channel = cfg.levelup_channel
+        if channel is None and cfg.levelup_channel_id:
+            channel = member.guild.get_channel(cfg.levelup_channel_id)
+        if not channel:
+            channel = fallback_channel
+
+        grant = self.roles.get(member.id)
+        if grant is None:
+            self.roles[member.id] = [member, prev_lvl, lvl_now, channel]
+        else:
+            grant[0], grant[1], grant[2] = member, min(grant[1], prev_lvl), max(grant[2], lvl_now)
+            grant[3] = grant[3] or channel
+
+        key = channel.id if channel else None
+        entry = self.channels.get(key)
+        if entry is None:
+            entry = self.channels[key] = (channel, {})
+        previous = entry[1].get(member.id)
+        if previous is None or previous[1] < lvl_now:
+            entry[1][member.id] = (member, lvl_now)
+
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.create_task(self._flush_later(key))
+
+    async def _flush_later(self, key):
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.tasks.pop(key, None)
+        await self.flush_channel(key)
+        await self.flush_roles()
+
+    async def flush_channel(self, key):
+        channel, members = self.channels.pop(key, (None, {}))
+        if not members:
+            return
+        if channel:
+            lines = [f"🎉 {m.mention} subiu para o nível **{lvl}**!" for m, lvl in members.values()]
+            chunk = ""
+            for line in lines:
+                if len(chunk) + len(line) + 1 > 2000:
+                    await self._send(channel, chunk)
+                    chunk = ""
+                chunk = f"{chunk}\n{line}" if chunk else line
+            if chunk:
+                await self._send(channel, chunk)
+        add_log("level_up: " + ", ".join(f"user={m.id} level={lvl}" for m, lvl in members.values()))
+
+    async def flush_roles(self):
+        grants, self.roles = self.roles, {}
+        denied_channels = set()
+        for member, prev_lvl, lvl_now, channel in grants.values():
+            owned = {r.id for r in member.roles}
+            roles = []
+            for lvl in range(prev_lvl + 1, lvl_now + 1):
+                role = cfg.level_roles.get(lvl)
+                if role is None and lvl in cfg.level_role_ids:
+                    role = member.guild.get_role(cfg.level_role_ids[lvl])
+                if role and role.id not in owned:
+                    roles.append(role)
+            if not roles:
+                continue
+            try:
+                await member.add_roles(*roles, reason=f"Alcançou nível {lvl_now}")
+            except discord.Forbidden:
+                if channel and channel.id not in denied_channels:
+                    denied_channels.add(channel.id)
+                    await self._send(channel, "⚠️ Não consegui dar cargos de nível, verifique minhas permissões.")
+            except discord.HTTPException as e:
+                print(f"Erro ao dar cargos de nível para {member.id}: {e}")
+
+    @staticmethod
+    async def _send(channel, content):
+        try:
+            await channel.send(content)
+        except Exception as e:
+            print(f"Erro ao enviar mensagem de level up: {e}")
+
+levelup_announcer = LevelUpAnnouncer()
+
+def announce_level_up(member: discord.Member, prev_lvl: int, lvl_now: int, fallback_channel=None):
+    """Enfileira o anúncio de level up e o cargo do nível (ver LevelUpAnnouncer)"""
+    levelup_announcer.queue(member, prev_lvl, lvl_now, fallback_channel)
+
+# ========================
+# XP POR VOZ
+# ========================
+VOICE_XP_TICK = 60  # segundos entre créditos de XP de voz
+
+voice_sessions = {}  # member_id -> {"channel": channel_id, "since": epoch}
+voice_channel_members = {}  # channel_id -> set(member_id)
+voice_xp_task = None
+
+def voice_index_join(member_id: int, channel_id: int):
+    """Registra a entrada de um membro em um canal de voz no índice"""
+    voice_index_leave(member_id)
+    voice_sessions[member_id] = {"channel": channel_id, "since": time.time()}
+    voice_channel_members.setdefault(channel_id, set()).add(member_id)
+
+def voice_index_leave(member_id: int):
+    """Remove o membro do índice de voz"""
+    session = voice_sessions.pop(member_id, None)
+    if not session:
+        return
+    members = voice_channel_members.get(session["channel"])
+    if members is not None:
+        members.discard(member_id)
+        if not members:
+            del voice_channel_members[session["channel"]]
+
+def seed_voice_index():
+    """Popula o índice com quem já está em call quando o bot conecta"""
+    voice_sessions.clear()
+    voice_channel_members.clear()
+    for guild in bot.guilds:
+        for channel in list(guild.voice_channels) + list(guild.stage_channels):
+            for member in channel.members:
+                if not member.bot:
+                    voice_index_join(member.id, channel.id)
+
+def is_voice_eligible(voice_state) -> bool:
+    return not (
+        voice_state.self_mute or voice_state.mute
+        or voice_state.self_deaf or voice_state.deaf
+        or voice_state.afk
+    )
+
+async def credit_voice_xp():
+    """Credita XP de voz para todos os membros elegíveis em uma única passada"""
+    if not cfg.voice_xp or not voice_channel_members:
+        return 0
+
+    xp_gain = max(1, cfg.voice_xp // cfg.xp_rate)
+    credited = 0
+    level_ups = []
+
+    for channel_id, member_ids in list(voice_channel_members.items()):
+        # Sozinho na call não ganha XP
+        if len(member_ids) < 2:
+            continue
+        channel = bot.get_channel(channel_id)
+        if channel is None:
+            continue
+
+        present = []
+        for member_id in list(member_ids):
+            member = channel.guild.get_member(member_id)
+            voice_state = member.voice if member else None
+            if not voice_state or not voice_state.channel or voice_state.channel.id != channel_id:
+                voice_index_leave(member_id)
+                continue
+            present.append((member_id, member, voice_state))
+
+        # Ensurdecidos não contam como companhia: duas contas AFK não farmam XP
+        listeners = sum(1 for _, _, vs in present if not (vs.self_deaf or vs.deaf))
+        if listeners < 2:
+            continue
+
+        for member_id, member, voice_state in present:
+            if not is_voice_eligible(voice_state):
+                continue
+
+            prev_lvl, lvl_now = grant_xp(str(member_id), xp_gain)
+            activity_stats.record(str(member_id), channel_id, xp=xp_gain)
+            credited += 1
+            if lvl_now > prev_lvl:
+                level_ups.append((member, prev_lvl, lvl_now))
+
+    if credited:
+        save_data_to_github(f"Voice XP tick ({credited} membros)")
+    # Os cargos de nível saem mesmo sem canal de level up (LevelUpAnnouncer.flush_roles)
+    for member, prev_lvl, lvl_now in level_ups:
+        announce_level_up(member, prev_lvl, lvl_now)
+    return credited
+
+async def voice_xp_loop():
+    """Tick periódico único que credita XP de voz em lote"""
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        await asyncio.sleep(VOICE_XP_TICK)
+        try:
+            credited = await credit_voice_xp()
+            if credited:
+                print(f"[VOICE XP] {credited} membros creditados")
+        except Exception as e:
+            print(f"[VOICE XP] Erro no tick: {e}")
+
+def start_voice_xp_loop():
+    global voice_xp_task
+    if voice_xp_task is not None and not voice_xp_task.done():
+        return False
+    voice_xp_task = bot.loop.create_task(voice_xp_loop())
+    return True
+
 @bot.event
-async def on_message(message: discord.Message):
-    if message.author.bot:
+async def on_voice_state_update(member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+    if member.bot:
+        return
+    before_id = before.channel.id if before.channel else None
+    after_id = after.channel.id if after.channel else None
+    if before_id == after_id:
         return
+    if after_id is None:
+        voice_index_leave(member.id)
+    else:
+        voice_index_join(member.id, after_id)
 
-    uid = str(message.author.id)
-    content = message.content.strip()
-    delete_message = False
+# ========================
+# IMPORTAÇÃO DE HISTÓRICO (BACKFILL DE XP)
+# ========================
+BACKFILL_CONCURRENCY = 3          # canais lidos em paralelo
+BACKFILL_CHECKPOINT_EVERY = 5000  # mensagens entre checkpoints salvos
+BACKFILL_PAUSE_EVERY = 500        # mensagens entre pausas curtas por canal
+
+backfill_task = None
+
+def is_staff_member(member) -> bool:
+    return member_flags.get(member)[0]
+
+def historical_message_xp(message, previous_content, awards, link_policy, cooldown):
+    """Aplica a uma mensagem antiga as mesmas regras de XP do on_message
+
+    `awards` são os instantes (ordenados) em que o usuário já ganhou XP em
+    qualquer canal. Os canais são lidos em paralelo, fora de ordem entre si,
+    então o cooldown vale para os dois lados: nenhum ganho a menos de
+    `cooldown` segundos de outro, como no on_message.
+    Retorna o XP ganho (0 quando alguma regra bloqueia o ganho).
+    """
+    verdict = cfg.engine.classify(message.content, message.attachments, message.stickers)
+    if verdict.is_bot_command or verdict.has_media:
+        return 0
+
+    # Canal com moderação desligada (/etapas_canal) não bloqueia ganho por link, repetição ou CAPS
+    moderated = message.channel.id not in cfg.moderation_off_channels
+    if moderated and not is_staff_member(message.author):
+        if verdict.link_hosts and link_policy.violation(message.channel.id, verdict.link_hosts) is not None:
+            return 0
+        if previous_content is not None and verdict.content == previous_content:
+            return 0
+        if verdict.is_caps:
+            return 0
+
+    ts = message.created_at.timestamp()
+    i = bisect.bisect_left(awards, ts)
+    if (i > 0 and ts - awards[i - 1] < cooldown) or (i < len(awards) and awards[i] - ts < cooldown):
+        return 0
+    return cfg.xp_gain
+
+async def backfill_channel(channel, state, semaphore, progress, users):
+    """Percorre o histórico de um canal a partir do cursor salvo, acumulando XP pendente
+
+    `users` é o estado por usuário compartilhado entre todos os canais
+    (última mensagem e instantes com ganho), como o on_message faz.
+    """
+    cursor = state["channels"].setdefault(str(channel.id), {"after": None, "done": False, "count": 0})
+    if cursor["done"]:
+        return
+    if channel.id in cfg.xp_off_channels:
+        # XP desligado no canal (/etapas_canal): nada a creditar, nem precisa ler o histórico
+        cursor["done"] = True
+        cursor["skipped"] = "xp desligado"
+        return
+
+    link_policy = cfg.link_policy
+    cooldown = cfg.xp_cooldown
+    pending = state["pending_xp"]
+    previous, awards = users["previous"], users["awards"]
+    before = discord.Object(id=int(state["before"]))
 
-    mudae_commands = [
-        "$w", "$wa", "$wg", "$h", "$ha", "$hg",
-        "$W", "$WA", "$WG", "$H", "$HA", "$HG",
-        "$tu", "$TU", "$dk", "$mmi", "$vote", "$rolls", "$k", "$mu"
+    async with semaphore:
+        after = discord.Object(id=int(cursor["after"])) if cursor["after"] else None
+        try:
+            async for msg in channel.history(limit=None, after=after, before=before, oldest_first=True):
+                cursor["after"] = str(msg.id)
+                cursor["count"] += 1
+                progress["messages"] += 1
+
+                if not msg.author.bot and msg.type in (discord.MessageType.default, discord.MessageType.reply):
+                    uid = str(msg.author.id)
+                    times = awards.setdefault(uid, [])
+                    gain = historical_message_xp(msg, previous.get(uid), times, link_policy, cooldown)
+                    previous[uid] = msg.content.strip()
+                    if gain:
+                        pending[uid] = pending.get(uid, 0) + gain
+                        bisect.insort(times, msg.created_at.timestamp())
+
+                if cursor["count"] % BACKFILL_PAUSE_EVERY == 0:
+                    await asyncio.sleep(1)
+                if progress["messages"] - progress["checkpoint"] >= BACKFILL_CHECKPOINT_EVERY:
+                    progress["checkpoint"] = progress["messages"]
+                    save_data_to_github(f"Backfill checkpoint ({progress['messages']} mensagens)")
+        except discord.HTTPException as e:
+            # Rate limit o discord.py já espera sozinho; o resto (sem acesso, canal
+            # apagado) não melhora tentando de novo: fecha o canal com o erro
+            cursor["error"] = f"{e.status}: {e.text or e}"
+            print(f"[BACKFILL] ❌ #{channel.name}: {cursor['error']}")
+
+    cursor["done"] = True
+    print(f"[BACKFILL] ✅ #{channel.name}: {cursor['count']} mensagens")
+
+async def run_backfill(guild: discord.Guild):
+    """Importa XP do histórico de todos os canais de texto e aplica em uma única atualização"""
+    state = data["backfill"]
+    progress = {"messages": 0, "checkpoint": 0}
+    semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+    me = guild.me
+
+    channels = [
+        c for c in guild.text_channels
+        if c.permissions_for(me).read_message_history and c.permissions_for(me).read_messages
     ]
-    if any(content.lower().startswith(cmd) for cmd in mudae_commands):
-        await bot.process_commands(message)
-        return
+    # Canais do progresso salvo que sumiram (apagados ou sem acesso) não travam a importação
+    visible = {str(c.id) for c in channels}
+    for channel_id, cursor in state["channels"].items():
+        if not cursor["done"] and channel_id not in visible:
+            cursor["done"] = True
+            cursor["error"] = "canal não encontrado ou sem acesso"
+
+    users = {"previous": {}, "awards": {}}
+    results = await asyncio.gather(
+        *(backfill_channel(c, state, semaphore, progress, users) for c in channels),
+        return_exceptions=True
+    )
+    for channel, result in zip(channels, results):
+        if isinstance(result, Exception):
+            print(f"[BACKFILL] ❌ Erro em #{channel.name}: {result}")
 
-    ignored_roles = {"Administrador", "Moderador"}
-    member_roles = {r.name for r in message.author.roles}
-    is_staff = any(role in ignored_roles for role in member_roles)
+    if not all(c["done"] for c in state["channels"].values()):
+        state["status"] = "interrupted"
+        save_data_to_github("Backfill interrupted")
+        return False
 
-    has_media = False
-    if message.attachments:
-        has_media = True
-    if message.stickers:
-        has_media = True
-    gif_domains = ["tenor.com", "media.tenor.com", "giphy.com", "imgur.com"]
-    if any(domain in content.lower() for domain in gif_domains):
-        has_media = True
+    pending = state.pop("pending_xp", {})
+    for uid, gain in pending.items():
+        grant_xp(uid, gain, count_season=False)
+    state["status"] = "done"
+    state["finished"] = now_br().isoformat()
+    state["users"] = len(pending)
+    save_data_to_github(f"Backfill XP ({len(pending)} usuários)")
+    add_log(f"backfill_done: users={len(pending)} messages={sum(c['count'] for c in state['channels'].values())}")
+    return True
 
-    if has_media:
-        await bot.process_commands(message)
-        return
+def start_backfill(guild: discord.Guild, restart=False):
+    """Inicia (ou retoma a partir dos cursores) a importação do histórico"""
+    global backfill_task
+    if backfill_task is not None and not backfill_task.done():
+        return False
 
-    blocked_channels = data.get("blocked_links_channels", [])
-    if message.channel.id in blocked_channels:
-        import re
-        url_pattern = r"https?://[^\s]+"
-        if re.search(url_pattern, content):
-            if not is_staff:
-                try:
-                    await message.delete()
-                except discord.Forbidden:
-                    pass
-                await message.channel.send(f"⚠️ {message.author.mention}, links não são permitidos aqui!")
-                await add_warn(message.author, reason="Enviou link em canal bloqueado")
-                return
-
-    user_msgs = data.setdefault("last_messages_content", {}).setdefault(uid, [])
-    if len(user_msgs) >= 5:
-        user_msgs.pop(0)
-
-    if user_msgs and content == user_msgs[-1]:
-        if not is_staff:
-            delete_message = True
-            try:
-                await message.delete()
-            except discord.Forbidden:
-                pass
-            await message.channel.send(f"⚠️ {message.author.mention}, evite enviar mensagens repetidas!")
-            await add_warn(message.author, reason="Spam detectado")
-            return
+    state = data.get("backfill")
+    if restart or not state:
+        data["backfill"] = {
+            "status": "running",
+            "started": now_br().isoformat(),
+            "before": str(discord.utils.time_snowflake(discord.utils.utcnow())),
+            "channels": {},
+            "pending_xp": {},
+        }
     else:
-        user_msgs.append(content)
-    data["last_messages_content"][uid] = user_msgs
+        state["status"] = "running"
+        state.setdefault("pending_xp", {})
+    backfill_task = bot.loop.create_task(run_backfill(guild))
+    return True
 
-    if len(content) > 5 and content.isupper():
-        if not is_staff:
-            delete_message = True
-            try:
-                await message.delete()
-            except discord.Forbidden:
-                pass
-            await message.channel.send(f"⚠️ {message.author.mention}, evite escrever tudo em maiúsculas!")
-            await add_warn(message.author, reason="Uso excessivo de maiúsculas")
-            return
+# ========================
+# PIPELINE DE MENSAGENS
+# ========================
+PIPELINE_STAGES = ("classify", "staff", "links", "spam", "xp", "commands", "total")
+
+class StageMetrics:
+    """Latência por etapa do on_message: contagem, soma, máximo e histograma log2 (µs)
+
+    O histograma tem 24 baldes de potência de 2, o que basta para estimar
+    p50/p95 sem guardar amostras; registrar é O(1).
+    """
+
+    BUCKETS = 24
+
+    def __init__(self, stages=PIPELINE_STAGES):
+        self.stages = {name: [0, 0, 0, [0] * self.BUCKETS] for name in stages}
+        self.since = time.time()
+
+    def add(self, stage: str, elapsed_ns: int):
+        entry = self.stages[stage]
+        entry[0] += 1
+        entry[1] += elapsed_ns
+        if elapsed_ns > entry[2]:
+            entry[2] = elapsed_ns
+        entry[3][min((elapsed_ns // 1000).bit_length(), self.BUCKETS - 1)] += 1
+
+    @staticmethod
+    def _percentile(buckets, count, q):
+        target = count * q
+        seen = 0
+        for i, n in enumerate(buckets):
+            seen += n
+            if seen >= target:
+                return (1 << i) if i else 1
+        return 1 << (len(buckets) - 1)
+
+    def summary(self):
+        result = {}
+        for name, (count, total, peak, buckets) in self.stages.items():
+            if not count:
+                continue
+            result[name] = {
+                "count": count,
+                "avg_us": round(total / count / 1000, 1),
+                "max_us": round(peak / 1000, 1),
+                "p50_us": self._percentile(buckets, count, 0.50),
+                "p95_us": self._percentile(buckets, count, 0.95),
+            }
+        return {"since": datetime.fromtimestamp(self.since).isoformat(), "stages": result}
 
-    if not delete_message:
-        data.setdefault("xp", {})
-        data.setdefault("level", {})
+    def reset(self):
+        self.__init__(tuple(self.stages))
 
-        xp_rate = data.get("config", {}).get("xp_rate", 3)
-        xp_gain = max(1, xp_for_message() // xp_rate)
-        data["xp"][uid] = data["xp"].get(uid, 0) + xp_gain
+pipeline_metrics = StageMetrics()
 
-        xp_now = data["xp"][uid]
-        lvl_now = xp_to_level(xp_now)
-        prev_lvl = data["level"].get(uid, 1)
+def set_channel_pipeline(channel_id, xp: bool, moderation: bool):
+    """Liga/desliga as etapas de XP e moderação de um canal (padrão: tudo ligado)"""
+    pipeline = data.setdefault("config", {}).setdefault("channel_pipeline", {})
+    if xp and moderation:
+        pipeline.pop(str(channel_id), None)
+    else:
+        pipeline[str(channel_id)] = {"xp": xp, "moderation": moderation}
+    rebuild_config()
 
-        if lvl_now > prev_lvl:
-            data["level"][uid] = lvl_now
+# ========================
+# ON MESSAGE
+# ========================
+@bot.event
+async def on_message(message: discord.Message):
+    if message.author.bot:
+        return
 
-            levelup_channel_id = data.get("config", {}).get("levelup_channel")
-            channel_to_send = None
+    clock = time.perf_counter_ns
+    metrics = pipeline_metrics.add
+    started = clock()
 
-            if levelup_channel_id:
-                channel_to_send = message.guild.get_channel(int(levelup_channel_id))
-            if not channel_to_send:
-                channel_to_send = message.channel
+    uid = str(message.author.id)
+    channel_id = message.channel.id
+    config = cfg
+    verdict = config.engine.classify(message.content, message.attachments, message.stickers)
+    activity_stats.record(uid, channel_id, msgs=1)
+    metrics("classify", clock() - started)
+
+    # Comandos da Mudae e mídia pura (só anexos/links de GIF) não passam por moderação nem XP
+    if verdict.is_bot_command or verdict.has_media:
+        await bot.process_commands(message)
+        metrics("total", clock() - started)
+        return
 
-            try:
-                await channel_to_send.send(f"🎉 {message.author.mention} subiu para o nível **{lvl_now}**!")
-            except Exception as e:
-                print(f"Erro ao enviar mensagem de level up: {e}")
+    # Moderação da checagem mais barata para a mais cara; canais podem desligá-la
+    violation = None
+    if channel_id not in config.moderation_off_channels:
+        t0 = clock()
+        is_staff = is_staff_member(message.author)
+        metrics("staff", clock() - t0)
+
+        if not is_staff and verdict.is_caps:
+            # is_caps já veio da classificação: checagem sem custo
+            violation = ("evite escrever tudo em maiúsculas!", "Uso excessivo de maiúsculas")
+
+        if not is_staff and violation is None and verdict.link_hosts:
+            t0 = clock()
+            blocked_host = config.link_policy.violation(channel_id, verdict.link_hosts)
+            metrics("links", clock() - t0)
+            if blocked_host is not None:
+                violation = ("links não são permitidos aqui!", f"Enviou link bloqueado ({blocked_host or 'sem domínio'})")
+
+        if not is_staff and violation is None:
+            t0 = clock()
+            spam_reason = spam_detector.check(uid, channel_id, verdict.lowered)
+            metrics("spam", clock() - t0)
+            if spam_reason:
+                violation = (SPAM_WARNINGS[spam_reason], f"Spam detectado ({spam_reason})")
+
+    if violation is not None:
+        warning, reason = violation
+        try:
+            await message.delete()
+        except discord.Forbidden:
+            pass
+        await message.channel.send(f"⚠️ {message.author.mention}, {warning}")
+        await add_warn(message.author, reason=reason, channel=channel_id)
+        metrics("total", clock() - started)
+        return
 
-            level_roles = data.get("level_roles", {})
-            role_id = level_roles.get(str(lvl_now))
-            if role_id:
-                role = message.guild.get_role(int(role_id))
-                if role:
-                    try:
-                        await message.author.add_roles(role, reason=f"Alcançou nível {lvl_now}")
-                    except discord.Forbidden:
-                        await channel_to_send.send(
-                            f"⚠️ Não consegui dar o cargo {role.mention}, verifique minhas permissões."
-                        )
+    # Mensagens dentro do cooldown não passam pelo caminho de XP (nem salvam)
+    if channel_id not in config.xp_off_channels and get_xp_cooldown_wheel().try_acquire(uid):
+        t0 = clock()
+        xp_gain = config.xp_gain
+        prev_lvl, lvl_now = grant_xp(uid, xp_gain)
+        activity_stats.record(uid, channel_id, xp=xp_gain)
 
-            add_log(f"level_up: user={uid} level={lvl_now}")
+        if lvl_now > prev_lvl:
+            announce_level_up(message.author, prev_lvl, lvl_now, message.channel)
 
-    try:
-        save_data_to_github("XP update")
-    except Exception as e:
-        print(f"Erro ao salvar XP: {e}")
+        try:
+            save_data_to_github("XP update")
+        except Exception as e:
+            print(f"Erro ao salvar XP: {e}")
+        metrics("xp", clock() - t0)
 
+    t0 = clock()
     await bot.process_commands(message)
+    done = clock()
+    metrics("commands", done - t0)
+    metrics("total", done - started)
 
 # ========================
 # SLASH COMMANDS
 # ========================
 def is_admin_check(interaction: discord.Interaction) -> bool:
     try:
-        perms = interaction.user.guild_permissions
-        return perms.administrator or perms.manage_guild or perms.manage_roles
+        return member_flags.get(interaction.user)[1]
     except Exception:
         return False
         
 def is_command_allowed(interaction: discord.Interaction, command_name: str) -> bool:
-    allowed = data.get("command_channels", {}).get(command_name, [])
-    if not allowed:
-        return True
-    return interaction.channel_id in allowed
+    return cfg.channel_allowed(command_name, interaction.channel_id)
 
 #/cargo_xp
 @tree.command(name="cargo_xp", description="Define um cargo para ser atribuído ao atingir certo nível (admin)")
@@ -3524,6 +6172,7 @@ async def set_level_role(interaction: discord.Interaction, level: int, role: dis
         return
 
     data.setdefault("level_roles", {})[str(level)] = str(role.id)
+    rebuild_config()
     save_data_to_github("Set level role")
 
     await interaction.response.send_message(
@@ -3531,6 +6180,54 @@ async def set_level_role(interaction: discord.Interaction, level: int, role: dis
         ephemeral=False
     )
 
+#/modo_raid
+@tree.command(name="modo_raid", description="Configura a detecção de raid por entradas em massa (admin)")
+@app_commands.describe(
+    entradas="Quantidade de entradas que dispara o modo raid",
+    janela="Janela em segundos para contar as entradas",
+    quarentena="Cargo aplicado automaticamente durante o raid (opcional)"
+)
+async def set_raid_mode(interaction: discord.Interaction, entradas: int, janela: int, quarentena: discord.Role = None):
+    if not is_admin_check(interaction):
+        await interaction.response.send_message("❌ Você não tem permissão.", ephemeral=True)
+        return
+    if entradas < 2 or janela < 1:
+        await interaction.response.send_message("❌ Use pelo menos 2 entradas e 1 segundo.", ephemeral=True)
+        return
+
+    raid = data.setdefault("config", {}).setdefault("raid", {})
+    raid["threshold"] = entradas
+    raid["window"] = janela
+    raid["quarantine_role"] = str(quarentena.id) if quarentena else None
+
+    rebuild_config()
+    save_data_to_github("Set raid mode")
+    await interaction.response.send_message(
+        f"✅ Modo raid: **{entradas}** entradas em **{janela}s**"
+        + (f", quarentena com {quarentena.mention}." if quarentena else ", sem quarentena."),
+        ephemeral=False
+    )
+
+#/cargo_staff
+@tree.command(name="cargo_staff", description="Adiciona ou remove um cargo da lista de staff isenta da moderação (admin)")
+@app_commands.describe(role="Cargo de staff")
+async def set_staff_role(interaction: discord.Interaction, role: discord.Role):
+    if not is_admin_check(interaction):
+        await interaction.response.send_message("❌ Você não tem permissão.", ephemeral=True)
+        return
+
+    staff_roles = data.setdefault("config", {}).setdefault("staff_roles", [])
+    if str(role.id) in staff_roles:
+        staff_roles.remove(str(role.id))
+        msg = f"❌ {role.mention} **não é mais** cargo de staff."
+    else:
+        staff_roles.append(str(role.id))
+        msg = f"✅ {role.mention} agora é cargo de staff (isento da moderação automática)."
+
+    rebuild_config()
+    save_data_to_github("Set staff roles")
+    await interaction.response.send_message(msg, ephemeral=False)
+
 #/xp_rate
 @tree.command(name="xp_rate", description="Define a taxa de ganho de XP (admin)")
 @app_commands.describe(rate="Taxa de XP — valores menores tornam o up mais lento")
@@ -3544,10 +6241,53 @@ async def set_xp_rate(interaction: discord.Interaction, rate: int):
         return
 
     data.setdefault("config", {})["xp_rate"] = rate
+    rebuild_config()
     save_data_to_github("Set XP rate")
 
     await interaction.response.send_message(f"✅ Taxa de XP ajustada para **x{rate}**. Agora é **{rate}x mais difícil** subir de nível.", ephemeral=False)
 
+#/xp_cooldown
+@tree.command(name="xp_cooldown", description="Define o intervalo mínimo entre ganhos de XP por usuário (admin)")
+@app_commands.describe(seconds="Segundos entre ganhos de XP (0 desativa o cooldown)")
+async def set_xp_cooldown(interaction: discord.Interaction, seconds: int):
+    if not is_admin_check(interaction):
+        await interaction.response.send_message("❌ Você não tem permissão para usar este comando.", ephemeral=True)
+        return
+
+    if seconds < 0 or seconds > 3600:
+        await interaction.response.send_message("⚠️ Use um valor entre 0 e 3600 segundos.", ephemeral=True)
+        return
+
+    data.setdefault("config", {})["xp_cooldown"] = seconds
+    rebuild_config()
+    save_data_to_github("Set XP cooldown")
+
+    if seconds:
+        await interaction.response.send_message(f"✅ Cooldown de XP ajustado para **{seconds}s** por usuário.", ephemeral=False)
+    else:
+        await interaction.response.send_message("✅ Cooldown de XP desativado.", ephemeral=False)
+
+#/xp_voz
+@tree.command(name="xp_voz", description="Define quanto XP por minuto os membros ganham em call (admin)")
+@app_commands.describe(amount="XP por minuto em call antes da taxa de XP (0 desativa)")
+async def set_voice_xp(interaction: discord.Interaction, amount: int):
+    if not is_admin_check(interaction):
+        await interaction.response.send_message("❌ Você não tem permissão para usar este comando.", ephemeral=True)
+        return
+
+    if amount < 0:
+        await interaction.response.send_message("⚠️ O valor mínimo é 0.", ephemeral=True)
+        return
+
+    data.setdefault("config", {})["voice_xp"] = amount
+    rebuild_config()
+    save_data_to_github("Set voice XP")
+
+    if amount:
+        await interaction.response.send_message(f"✅ Membros em call agora ganham **{amount} XP** por minuto (antes da taxa).", ephemeral=False)
+    else:
+        await interaction.response.send_message("✅ XP por voz desativado.", ephemeral=False)
+
 #/mensagem_personalizada
 @tree.command(name="mensagem_personalizada", description="Cria uma mensagem personalizada (admin)")
 @app_commands.describe(
@@ -3607,6 +6347,7 @@ async def slash_setwelcomeimage(interaction: discord.Interaction, url: str = Non
     if not url:
         if "welcome_background" in config:
             del config["welcome_background"]
+            rebuild_config()
             save_data_to_github("Unset welcome background")
             await interaction.response.send_message("🧹 Imagem de fundo personalizada removida. Voltará a usar a padrão.", ephemeral=False)
         else:
@@ -3617,9 +6358,14 @@ async def slash_setwelcomeimage(interaction: discord.Interaction, url: str = Non
         await interaction.response.send_message("❌ Forneça uma URL válida começando com http:// ou https://", ephemeral=True)
         return
 
+    await interaction.response.defer(thinking=True)
     config["welcome_background"] = url
+    rebuild_config()
     save_data_to_github("Set welcome background")
-    await interaction.response.send_message(f"✅ Imagem de fundo definida com sucesso!\n{url}", ephemeral=False)
+    if not await asyncio.to_thread(welcome_bg_cache.refresh, url, True):
+        await interaction.followup.send(f"⚠️ Imagem salva, mas não consegui baixá-la agora (tentarei de novo na próxima entrada).\n{url}")
+        return
+    await interaction.followup.send(f"✅ Imagem de fundo definida com sucesso!\n{url}")
 
 #/definir_canal_comando
 @tree.command(name="definir_canal_comando", description="Define canais onde um comando pode ser usado (admin)")
@@ -3642,6 +6388,7 @@ async def slash_setcommandchannel(interaction: discord.Interaction, command: str
         channels.append(channel.id)
         msg = f"✅ O canal {channel.mention} **foi adicionado** para o comando `{command}`."
 
+    rebuild_config()
     save_data_to_github(f"Set command channel for {command}")
     await interaction.response.send_message(msg, ephemeral=False)
 
@@ -3697,17 +6444,60 @@ async def block_links(interaction: discord.Interaction, channel: discord.TextCha
     
     if channel.id in data["blocked_links_channels"]:
         data["blocked_links_channels"].remove(channel.id)
+        rebuild_config()
         save_data_to_github("Unblock links channel")
         await interaction.response.send_message(f"✅ Links desbloqueados no canal {channel.mention}.")
     else:
         data["blocked_links_channels"].append(channel.id)
+        rebuild_config()
         save_data_to_github("Block links channel")
         await interaction.response.send_message(f"✅ Links bloqueados no canal {channel.mention}.")
 
+#/etapas_canal
+@tree.command(name="etapas_canal", description="Liga ou desliga XP e moderação automática em um canal (admin)")
+@app_commands.describe(channel="Canal", xp="Ganhar XP neste canal", moderacao="Moderação automática neste canal")
+async def set_channel_stages(interaction: discord.Interaction, channel: discord.TextChannel, xp: bool, moderacao: bool):
+    if not is_admin_check(interaction):
+        await interaction.response.send_message("Você não tem permissão.", ephemeral=True)
+        return
+
+    set_channel_pipeline(channel.id, xp, moderacao)
+    save_data_to_github("Set channel pipeline")
+    await interaction.response.send_message(
+        f"✅ {channel.mention}: XP {'ligado' if xp else 'desligado'}, moderação {'ligada' if moderacao else 'desligada'}."
+    )
+
+#/regra_dominio
+@tree.command(name="regra_dominio", description="Permite ou bloqueia um domínio no servidor ou em um canal (admin)")
+@app_commands.describe(
+    dominio="Domínio, ex: youtube.com (vale para os subdomínios)",
+    acao="permitir, bloquear ou remover a regra",
+    channel="Canal da regra (vazio = servidor inteiro)"
+)
+@app_commands.choices(acao=[
+    app_commands.Choice(name="permitir", value="allow"),
+    app_commands.Choice(name="bloquear", value="deny"),
+    app_commands.Choice(name="remover", value="remove"),
+])
+async def set_domain_rule(interaction: discord.Interaction, dominio: str, acao: app_commands.Choice[str], channel: discord.TextChannel = None):
+    if not is_admin_check(interaction):
+        await interaction.response.send_message("Você não tem permissão.", ephemeral=True)
+        return
+
+    try:
+        domain = update_link_rule(dominio, acao.value, channel.id if channel else None)
+    except ValueError:
+        await interaction.response.send_message("❌ Domínio inválido.", ephemeral=True)
+        return
+
+    save_data_to_github(f"Link rule {domain}")
+    where = f"em {channel.mention}" if channel else "no servidor"
+    await interaction.response.send_message(f"✅ Regra para `{domain}` ({acao.name}) {where}.")
+
 #/perfil
 @tree.command(name="perfil", description="mostra o seu perfil")
-@app_commands.describe(member="Membro a ver o rank (opcional)")
-async def slash_rank(interaction: discord.Interaction, member: discord.Member = None):
+@app_commands.describe(member="Membro a ver o rank (opcional)", temporada="Número da temporada (opcional)")
+async def slash_rank(interaction: discord.Interaction, member: discord.Member = None, temporada: int = None):
     if not is_command_allowed(interaction, "rank"):
         await interaction.response.send_message("❌ Este comando só pode ser usado em canais autorizados.", ephemeral=True)
         return
@@ -3716,65 +6506,43 @@ async def slash_rank(interaction: discord.Interaction, member: discord.Member =
 
     target = member or interaction.user
     uid = str(target.id)
-    xp = data.get("xp", {}).get(uid, 0)
-    lvl = data.get("level", {}).get(uid, xp_to_level(xp))
-
-    ranking = sorted(data.get("xp", {}).items(), key=lambda t: t[1], reverse=True)
-    pos = next((i+1 for i, (u, _) in enumerate(ranking) if u == uid), len(ranking))
-
-    width, height = 900, 200
-    img = Image.new("RGBA", (width, height), (0, 0, 0, 255))
-    draw = ImageDraw.Draw(img)
-
-    try:
-        font_b = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 32)
-        font_s = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 22)
-    except:
-        font_b = ImageFont.load_default()
-        font_s = ImageFont.load_default()
+    if temporada is None:
+        xp = data.get("xp", {}).get(uid, 0)
+        lvl = data.get("level", {}).get(uid, xp_to_level(xp))
 
-    try:
-        avatar_bytes = await target.avatar.read()
-        avatar = Image.open(BytesIO(avatar_bytes)).convert("RGBA")
-        avatar = avatar.resize((120, 120))
-        mask = Image.new("L", (120, 120), 0)
-        mask_draw = ImageDraw.Draw(mask)
-        mask_draw.ellipse((0, 0, 120, 120), fill=255)
-        img.paste(avatar, (20, 40), mask)
-    except Exception as e:
-        print("Erro avatar:", e)
-
-    draw.text((160, 50), target.display_name, font=font_b, fill=(0, 255, 255))
-    draw.text((width - 220, 40), f"CLASSIFICAÇÃO #{pos}", font=font_s, fill=(0, 255, 255))
-    draw.text((width - 220, 80), f"NÍVEL {lvl}", font=font_s, fill=(255, 0, 255))
-
-    next_xp = 100 + lvl*50
-    cur = xp % next_xp
-    bar_total_w, bar_h = 560, 36
-    x0, y0 = 160, 140
-    radius = bar_h // 2
-
-    draw.rounded_rectangle([x0, y0, x0+bar_total_w, y0+bar_h], radius=radius, fill=(50, 50, 50))
-    
-    fill_w = int(bar_total_w * min(1.0, cur / next_xp))
-    if fill_w > 0:
-        filled_bar = Image.new("RGBA", (fill_w, bar_h), (0,0,0,0))
-        fill_draw = ImageDraw.Draw(filled_bar)
-        fill_draw.rounded_rectangle([0, 0, fill_w, bar_h], radius=radius, fill=(0, 200, 255))
-        img.paste(filled_bar, (x0, y0), filled_bar)
-
-    xp_text = f"{cur} / {next_xp} XP"
-    bbox = draw.textbbox((0, 0), xp_text, font=font_s)
-    text_w = bbox[2] - bbox[0]
-    text_h = bbox[3] - bbox[1]
-    text_x = x0 + (bar_total_w - text_w) // 2
-    text_y = y0 + (bar_h - text_h) // 2
-    draw.text((text_x, text_y), xp_text, font=font_s, fill=(255, 255, 255))
+        ranking = sorted(data.get("xp", {}).items(), key=lambda t: t[1], reverse=True)
+        pos = next((i+1 for i, (u, _) in enumerate(ranking) if u == uid), len(ranking))
+    else:
+        standings = await get_season_standings(temporada)
+        if standings is None:
+            await interaction.followup.send(f"❌ Temporada {temporada} não encontrada.")
+            return
+        pos, xp, lvl = standings.lookup(uid)
+
+    spec = {"name": target.display_name, "position": pos, "level": lvl, "xp": xp,
+            "template": cfg.card_templates.get("rank"), "theme": cfg.card_themes.get("rank", "default"),
+            "encoder": cfg.encoder}
+    card_key = rank_card_key(spec, target.display_avatar.key)
+    png = rank_card_cache.get(card_key)
+    if png is None:
+        try:
+            spec["avatar_tile"] = await fetch_avatar_tile(target, "rank")
+            png = await render_service.render(render_rank_card, spec)
+        except RenderBusyError:
+            await interaction.followup.send("⏳ Muitos cartões sendo gerados agora, tente de novo em instantes.")
+            return
+        except Exception as e:
+            print(f"Erro ao gerar cartão de rank: {e}")
+            cur, need = rank_progress(xp, lvl)
+            await interaction.followup.send(
+                f"📊 **{target.display_name}** — #{pos} | Nível {lvl} | {cur}/{need} XP"
+            )
+            return
+        # Sem avatar (download falhou) não entra no cache: a próxima tentativa busca de novo
+        if spec["avatar_tile"] is not None:
+            rank_card_cache.put(card_key, png)
 
-    buf = BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
-    file = discord.File(buf, filename="rank.png")
+    file = discord.File(BytesIO(png), filename=card_filename("rank", png))
     await interaction.followup.send(file=file)
 
 #/definir_boas-vindas
@@ -3786,24 +6554,129 @@ async def slash_setwelcome(interaction: discord.Interaction, message: str):
         return
 
     data.setdefault("config", {})["welcome_message"] = message
+    rebuild_config()
     save_data_to_github("Set welcome message")
     await interaction.response.send_message(f"Mensagem de boas-vindas definida!\n{message}")
 
 #/rank
 @tree.command(name="rank", description="Mostra top 10 de XP")
-async def slash_top(interaction: discord.Interaction):
+@app_commands.describe(
+    temporada="Número da temporada (opcional)",
+    pagina="Página do placar, 10 membros por página",
+    imagem="Mostra o placar como imagem com avatares"
+)
+async def slash_top(interaction: discord.Interaction, temporada: int = None, pagina: int = 1, imagem: bool = False):
     if not is_command_allowed(interaction, "top"):
         await interaction.response.send_message("❌ Este comando só pode ser usado em canais autorizados.", ephemeral=True)
         return
     await interaction.response.defer()
-    ranking = sorted(data.get("xp", {}).items(), key=lambda t: t[1], reverse=True)[:10]
-    lines = []
-    for i, (uid, xp) in enumerate(ranking, 1):
-        user = interaction.guild.get_member(int(uid))
-        name = user.display_name if user else f"Usuário {uid}"
-        lines.append(f"{i}. {name} — {xp} XP")
+    pagina = max(1, pagina)
+    start = (pagina - 1) * LEADERBOARD_PAGE
+    if temporada is None:
+        xp_map = data.get("xp", {})
+        top = heapq.nlargest(start + LEADERBOARD_PAGE, xp_map.items(), key=lambda t: t[1])[start:]
+        levels = data.get("level", {})
+        ranking = [(uid, xp, levels.get(uid, xp_to_level(xp))) for uid, xp in top]
+        title = "Top 10 XP"
+    else:
+        standings = await get_season_standings(temporada)
+        if standings is None:
+            await interaction.followup.send(f"❌ Temporada {temporada} não encontrada.")
+            return
+        ranking = [tuple(row) for row in standings.rows[start:start + LEADERBOARD_PAGE]]
+        title = f"Top 10 XP — Temporada {temporada}" + ("" if standings.archived else " (em andamento)")
+    if pagina > 1:
+        title += f" — página {pagina}"
+
+    members = [interaction.guild.get_member(int(uid)) for uid, _, _ in ranking]
+    names = [m.display_name if m else f"Usuário {uid}" for m, (uid, _, _) in zip(members, ranking)]
+
+    if imagem and ranking:
+        png = await leaderboard_image(title, start, ranking, members, names)
+        if png is not None:
+            await interaction.followup.send(file=discord.File(BytesIO(png), filename=card_filename("placar", png)))
+            return
+
+    lines = [f"{start + i}. {name} — {xp} XP" for i, (name, (_, xp, _)) in enumerate(zip(names, ranking), 1)]
     text = "\n".join(lines) if lines else "Sem dados ainda."
-    await interaction.followup.send(f"🏆 **Top 10 XP**\n{text}")
+    await interaction.followup.send(f"🏆 **{title}**\n{text}")
+
+async def leaderboard_image(title, start, ranking, members, names):
+    """Placar em imagem, do cache enquanto a página (membros, XP, nomes e avatares) não mudar
+
+    Retorna None se a renderização estiver ocupada (o /rank cai para texto).
+    """
+    avatar_keys = tuple(m.display_avatar.key if m else None for m in members)
+    key = (title, start, tuple(ranking), tuple(names), avatar_keys, tuple(sorted(cfg.encoder.items())))
+    png = leaderboard_cache.get(key)
+    if png is not None:
+        return png
+
+    try:
+        tiles = await fetch_leaderboard_tiles(members)
+        rows = [
+            {"position": start + i, "name": name, "xp": xp, "level": lvl, "avatar_tile": tile}
+            for i, (name, (_, xp, lvl), tile) in enumerate(zip(names, ranking, tiles), 1)
+        ]
+        png = await render_service.render(render_leaderboard_card, {"title": title, "rows": rows, "encoder": cfg.encoder})
+    except RenderBusyError:
+        return None
+    # Com avatar faltando (frio ou download falhou) não entra no cache: o próximo pedido já os encontra
+    if all(t is not None for m, t in zip(members, tiles) if m is not None):
+        leaderboard_cache.put(key, png)
+    return png
+
+#/importar_historico_xp
+@tree.command(name="importar_historico_xp", description="Calcula XP a partir do histórico dos canais de texto (admin)")
+@app_commands.describe(reiniciar="Descarta o progresso de uma importação interrompida e começa do zero")
+async def slash_backfill(interaction: discord.Interaction, reiniciar: bool = False):
+    if not is_admin_check(interaction):
+        await interaction.response.send_message("Você não tem permissão para usar este comando.", ephemeral=True)
+        return
+
+    if backfill_task is not None and not backfill_task.done():
+        state = data.get("backfill", {})
+        done = sum(1 for c in state.get("channels", {}).values() if c["done"])
+        read = sum(c["count"] for c in state.get("channels", {}).values())
+        await interaction.response.send_message(
+            f"⏳ Importação em andamento: {done} canais concluídos, {read} mensagens lidas.", ephemeral=True
+        )
+        return
+
+    # Importar de novo somaria o mesmo histórico duas vezes
+    state = data.get("backfill")
+    if state and state.get("status") == "done":
+        await interaction.response.send_message(
+            f"ℹ️ O histórico já foi importado em {state.get('finished', '?')}.", ephemeral=True
+        )
+        return
+
+    resuming = bool(state) and not reiniciar
+    start_backfill(interaction.guild, restart=reiniciar)
+    add_log(f"backfill_start: by={interaction.user.id} resume={resuming}")
+    await interaction.response.send_message(
+        "🔄 Retomando a importação do histórico a partir do último checkpoint..." if resuming
+        else "🔄 Importando XP do histórico dos canais. Isso pode levar um tempo."
+    )
+
+#/iniciar_temporada
+@tree.command(name="iniciar_temporada", description="Arquiva a classificação atual e inicia uma nova temporada (admin)")
+async def slash_start_season(interaction: discord.Interaction):
+    if not is_admin_check(interaction):
+        await interaction.response.send_message("Você não tem permissão para usar este comando.", ephemeral=True)
+        return
+    await interaction.response.defer()
+
+    meta = await archive_current_season()
+    if not meta:
+        await interaction.followup.send("❌ Falha ao arquivar a temporada atual (veja logs).")
+        return
+
+    add_log(f"season_start: archived={meta['id']} players={meta['players']} by={interaction.user.id}")
+    await interaction.followup.send(
+        f"🏁 Temporada {meta['id']} arquivada com {meta['players']} participantes.\n"
+        f"🚀 **Temporada {meta['id'] + 1}** começou! O XP vitalício continua acumulando."
+    )
 
 #/advertir
 @tree.command(name="advertir", description="Advertir um membro (admin)")
@@ -3812,16 +6685,71 @@ async def slash_warn(interaction: discord.Interaction, member: discord.Member, r
     if not is_admin_check(interaction):
         await interaction.response.send_message("Você não tem permissão para usar este comando.", ephemeral=True)
         return
-    uid = str(member.id)
-    entry = {
-        "by": interaction.user.id,
-        "reason": reason,
-        "ts": datetime.utcnow().strftime("%d/%m/%Y %H:%M")
+    # O escalonamento pode chamar timeout/kick (HTTP): responde ao Discord antes
+    await interaction.response.defer()
+    active = await add_warn(member, reason, actor=interaction.user.id, critical=True)
+    await interaction.followup.send(
+        f"⚠️ {member.mention} advertido.\nMotivo: {reason}\nAdvertências ativas: **{active}**"
+    )
+
+#/escalonamento
+@tree.command(name="escalonamento", description="Configura castigo/expulsão automáticos por advertências ativas (admin)")
+@app_commands.describe(
+    castigo_em="Advertências ativas para castigo (0 = desligado)",
+    expulsao_em="Advertências ativas para expulsão (0 = desligado)",
+    dias="Dias até uma advertência vencer",
+    minutos_castigo="Duração do castigo em minutos"
+)
+async def set_warn_escalation(interaction: discord.Interaction, castigo_em: int, expulsao_em: int, dias: int = 7, minutos_castigo: int = 60):
+    if not is_admin_check(interaction):
+        await interaction.response.send_message("Você não tem permissão.", ephemeral=True)
+        return
+    if min(castigo_em, expulsao_em) < 0 or dias < 1 or minutos_castigo < 1:
+        await interaction.response.send_message("❌ Valores inválidos.", ephemeral=True)
+        return
+
+    data.setdefault("config", {})["warns"] = {
+        "timeout_at": castigo_em,
+        "kick_at": expulsao_em,
+        "expire_days": dias,
+        "timeout_minutes": minutos_castigo,
     }
-    data.setdefault("warns", {}).setdefault(uid, []).append(entry)
-    save_data_to_github("New warn")
-    add_log(f"warn: user={uid} by={interaction.user.id} reason={reason}")
-    await interaction.response.send_message(f"⚠️ {member.mention} advertido.\nMotivo: {reason}")
+    rebuild_config()
+    save_data_to_github("Set warn escalation")
+    await interaction.response.send_message(
+        f"✅ Advertências valem por **{dias}** dias. "
+        f"Castigo ({minutos_castigo} min): {castigo_em or 'desligado'} | Expulsão: {expulsao_em or 'desligada'}."
+    )
+
+#/codificacao_cartoes
+@tree.command(name="codificacao_cartoes", description="Escolhe o formato das imagens de boas-vindas e rank (admin)")
+@app_commands.describe(
+    perfil="Formato dos cartões",
+    qualidade="Qualidade do WebP/JPEG (1-100)",
+    orcamento_ms="Tempo máximo de codificação por cartão no modo automático"
+)
+@app_commands.choices(perfil=[
+    app_commands.Choice(name="PNG padrão", value="png"),
+    app_commands.Choice(name="PNG otimizado", value="png_optimized"),
+    app_commands.Choice(name="PNG com paleta (cores chapadas)", value="palette"),
+    app_commands.Choice(name="WebP", value="webp"),
+    app_commands.Choice(name="JPEG", value="jpeg"),
+    app_commands.Choice(name="Automático (menor arquivo no orçamento)", value="auto"),
+])
+async def set_card_encoder(interaction: discord.Interaction, perfil: app_commands.Choice[str], qualidade: int = 85, orcamento_ms: int = 40):
+    if not is_admin_check(interaction):
+        await interaction.response.send_message("Você não tem permissão.", ephemeral=True)
+        return
+
+    encoder = dict(data.setdefault("config", {}).get("encoder", {}) or {})
+    encoder.update({"profile": perfil.value, "quality": qualidade, "budget_ms": orcamento_ms})
+    data["config"]["encoder"] = normalize_encoder_config(encoder)
+    rebuild_config()
+    save_data_to_github("Set card encoder")
+    await interaction.response.send_message(
+        f"✅ Cartões agora saem como **{perfil.name}** "
+        f"(qualidade {cfg.encoder['quality']}, orçamento {cfg.encoder['budget_ms']} ms)."
+    )
 
 #/lista_de_advertência
 @tree.command(name="lista_de_advertência", description="Mostra advertências de um membro")
@@ -3836,7 +6764,10 @@ async def slash_warns(interaction: discord.Interaction, member: discord.Member =
         await interaction.response.send_message(f"{target.mention} não tem advertências.", ephemeral=False)
         return
     text = "\n".join([f"- {w['reason']} (por <@{w['by']}>) em {w['ts']}" for w in arr])
-    await interaction.response.send_message(f"⚠️ Advertências de {target.mention}:\n{text}")
+    active = warn_index.count(str(target.id))
+    await interaction.response.send_message(
+        f"⚠️ Advertências de {target.mention} ({active} ativas nos últimos {cfg.warns['expire_days']} dias):\n{text}"
+    )
 
 #/savedata
 @tree.command(name="savedata", description="Força salvar dados no GitHub (admin)")
@@ -3856,10 +6787,12 @@ async def slash_setwelcome(interaction: discord.Interaction, channel: discord.Te
         return
     if channel is None:
         data.setdefault("config", {})["welcome_channel"] = None
+        rebuild_config()
         save_data_to_github("Unset welcome channel")
         await interaction.response.send_message("Canal de boas-vindas removido.")
     else:
         data.setdefault("config", {})["welcome_channel"] = str(channel.id)
+        rebuild_config()
         save_data_to_github("Set welcome channel")
         await interaction.response.send_message(f"Canal de boas-vindas definido: {channel.mention}")
 
@@ -3872,6 +6805,7 @@ async def set_levelup_channel(interaction: discord.Interaction, channel: discord
         return
 
     data.setdefault("config", {})["levelup_channel"] = channel.id
+    rebuild_config()
     save_data_to_github("Set level up channel")
 
     await interaction.response.send_message(f"✅ Canal de level up definido para {channel.mention}.", ephemeral=False)
@@ -4034,9 +6968,9 @@ def run_flask():
     port = int(os.environ.get("PORT", 8080))
     app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False)
 
-Thread(target=run_flask, daemon=True).start()
-
 if __name__ == "__main__":
+    Thread(target=auto_ping, daemon=True).start()
+    Thread(target=run_flask, daemon=True).start()
     try:
         bot.run(BOT_TOKEN)
     except Exception as e: